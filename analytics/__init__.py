@@ -0,0 +1,25 @@
+# Calculs des pages (sans Streamlit) : fonctions pures sur DataFrames / tableaux numpy,
+# mémorisables par les pages (st.cache_data) ou appelables depuis un script batch
+from analytics.geo import (
+    haversine, haversine_matrix, nearest, build_agence_index, k_nearest_agences,
+    enveloppes, enveloppes_agences,
+)
+from analytics.tranches import (
+    LABELS_POIDS, LABELS_UM, preparer_poids, preparer_palette, cube_poids, cube_palette,
+    crosstab, repartitions,
+)
+from analytics.tarifs import (
+    calculer_tarifs, balayage_tarifs, repartition_depuis_cube, coefficients_racine,
+)
+from analytics.statistiques import (
+    filtrer, totaux, top_communes, detail_poids, stats_poids, stats_palette, detail_palette, comptages,
+)
+from analytics.zones import (
+    ZONES, zone_suggeree, coordonnees_agence, comptage_zones, distances_par_zone, resumes_agences,
+)
+from analytics.strategie import (
+    expeditions_par_commune, localites_eloignees, clusters_eloignes, coordonnees_agences,
+    suggestions_reaffectation,
+)
+from analytics.clustering import ajuster_kmeans, ajuster_plage
+from analytics.implantation import poids_par_commune, demande_communes, implanter_agences
@@ -0,0 +1,45 @@
+import numpy as np
+import pandas as pd
+from joblib import Parallel, delayed
+from sklearn.cluster import KMeans, MiniBatchKMeans
+from sklearn.metrics import silhouette_score
+
+SEUIL_MINIBATCH = 20_000  # au-delà : MiniBatchKMeans
+ECHANTILLON_SILHOUETTE = 5_000  # la silhouette est quadratique : calculée sur un échantillon
+
+
+def ajuster_kmeans(X, k, seuil_minibatch=SEUIL_MINIBATCH, random_state=42):
+    if len(X) > seuil_minibatch:
+        modele = MiniBatchKMeans(n_clusters=k, random_state=random_state, n_init=3, batch_size=4096)
+    else:
+        modele = KMeans(n_clusters=k, random_state=random_state, n_init=10)
+    labels = modele.fit_predict(X)
+
+    silhouette = np.nan
+    if 1 < len(np.unique(labels)) < len(X):
+        silhouette = silhouette_score(
+            X, labels, sample_size=min(len(X), ECHANTILLON_SILHOUETTE), random_state=random_state
+        )
+    return {
+        "k": k,
+        "labels": labels,
+        "centres": modele.cluster_centers_,
+        "inertie": float(modele.inertia_),
+        "silhouette": float(silhouette),
+        "algorithme": type(modele).__name__,
+    }
+
+
+def ajuster_plage(X, ks=range(2, 7), seuil_minibatch=SEUIL_MINIBATCH, n_jobs=-1):
+    # Ajuste tous les k en parallèle (threads : KMeans libère le GIL) ; renvoie (modèles par k, scores)
+    X = np.asarray(X, dtype=float)
+    ks = [k for k in ks if k <= len(X)]
+    resultats = Parallel(n_jobs=n_jobs, prefer="threads")(
+        delayed(ajuster_kmeans)(X, k, seuil_minibatch) for k in ks
+    )
+    modeles = {r["k"]: r for r in resultats}
+    scores = pd.DataFrame(
+        [{"k": r["k"], "Inertie": r["inertie"], "Silhouette": r["silhouette"], "Algorithme": r["algorithme"]}
+         for r in resultats]
+    )
+    return modeles, scores
@@ -0,0 +1,100 @@
+import numpy as np
+import pandas as pd
+
+RAYON_TERRE_KM = 6371.0
+
+
+def _radians(values, dtype):
+    return np.radians(np.asarray(values, dtype=dtype))
+
+
+def haversine(lat1, lon1, lat2, lon2, dtype=np.float64):
+    # Distance en km, vectorisée : scalaires, tableaux de même taille ou un-vers-plusieurs (broadcast)
+    lat1, lon1, lat2, lon2 = (_radians(v, dtype) for v in (lat1, lon1, lat2, lon2))
+    dlat = lat2 - lat1
+    dlon = lon2 - lon1
+    a = np.sin(dlat / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin(dlon / 2) ** 2
+    d = 2 * RAYON_TERRE_KM * np.arcsin(np.sqrt(np.clip(a, 0, 1)))
+    return d.astype(dtype, copy=False)
+
+
+def haversine_matrix(lat1, lon1, lat2, lon2, dtype=np.float64, chunk_size=4096):
+    # Matrice (n1 x n2) des distances, calculée par blocs de lignes pour borner la mémoire
+    lat1, lon1 = _radians(lat1, dtype).ravel(), _radians(lon1, dtype).ravel()
+    lat2, lon2 = _radians(lat2, dtype).ravel(), _radians(lon2, dtype).ravel()
+    cos_lat2 = np.cos(lat2)
+
+    out = np.empty((len(lat1), len(lat2)), dtype=dtype)
+    for start in range(0, len(lat1), chunk_size):
+        stop = start + chunk_size
+        la1 = lat1[start:stop, None]
+        lo1 = lon1[start:stop, None]
+        a = np.sin((lat2 - la1) / 2) ** 2 + np.cos(la1) * cos_lat2 * np.sin((lon2 - lo1) / 2) ** 2
+        out[start:stop] = 2 * RAYON_TERRE_KM * np.arcsin(np.sqrt(np.clip(a, 0, 1)))
+    return out
+
+
+def nearest(lat1, lon1, lat2, lon2, dtype=np.float64, chunk_size=4096):
+    # Pour chaque point 1 : indice et distance du point 2 le plus proche (NaN ignorés)
+    d = haversine_matrix(lat1, lon1, lat2, lon2, dtype=dtype, chunk_size=chunk_size)
+    d[np.isnan(d)] = np.inf
+    idx = d.argmin(axis=1) if d.shape[1] else np.zeros(d.shape[0], dtype=int)
+    dist = d[np.arange(d.shape[0]), idx] if d.shape[1] else np.full(d.shape[0], np.inf)
+    return idx, dist
+
+
+def build_agence_index(codes, lat, lon):
+    # BallTree (métrique haversine) sur les coordonnées des agences
+    from sklearn.neighbors import BallTree
+
+    coords = np.column_stack([_radians(lat, np.float64), _radians(lon, np.float64)])
+    valides = ~np.isnan(coords).any(axis=1)
+    tree = BallTree(coords[valides], metric="haversine")
+    return tree, np.asarray(codes)[valides]
+
+
+def k_nearest_agences(index, lat, lon, k=1):
+    # k agences les plus proches de chaque point, en une requête groupée.
+    # Renvoie (codes, distances_km) de forme (n, k) ; lignes sans coordonnées -> None / inf
+    tree, codes = index
+    k = max(1, min(k, len(codes)))
+    points = np.column_stack([_radians(lat, np.float64), _radians(lon, np.float64)])
+    valides = ~np.isnan(points).any(axis=1)
+
+    out_codes = np.full((len(points), k), None, dtype=object)
+    out_dist = np.full((len(points), k), np.inf)
+    if valides.any() and len(codes):
+        dist, ind = tree.query(points[valides], k=k)
+        out_codes[valides] = codes[ind]
+        out_dist[valides] = dist * RAYON_TERRE_KM
+    return out_codes, out_dist
+
+
+def enveloppes(df, groupes, ratio=0.3, tolerance=0.001):
+    # Polygone englobant les localités de chaque groupe (enveloppe concave, convexe si ratio >= 1).
+    # Renvoie un DataFrame : colonnes de groupe, Nb_localites, geojson (géométrie sérialisée)
+    import json
+    import shapely
+    from shapely.geometry import MultiPoint, mapping
+
+    df = df.dropna(subset=["Latitude", "Longitude"])
+    lignes = []
+    for cle, groupe in df.groupby(groupes, observed=True, sort=True):
+        cle = cle if isinstance(cle, tuple) else (cle,)
+        points = MultiPoint(np.column_stack([groupe["Longitude"].to_numpy(float), groupe["Latitude"].to_numpy(float)]))
+        forme = shapely.concave_hull(points, ratio=ratio) if ratio < 1 else points.convex_hull
+        if forme.geom_type not in ("Polygon", "MultiPolygon"):
+            forme = forme.buffer(0.01)  # 1 ou 2 localités : petit disque autour
+        lignes.append({
+            **dict(zip(groupes, cle)),
+            "Nb_localites": len(groupe),
+            "geojson": json.dumps(mapping(forme.simplify(tolerance))),
+        })
+    return pd.DataFrame(lignes, columns=list(groupes) + ["Nb_localites", "geojson"])
+
+
+def enveloppes_agences(df, ratio=0.3):
+    # Enveloppes par agence (Zone vide) et par agence x zone, dans un même tableau
+    par_agence = enveloppes(df, ["Code agence"], ratio=ratio).assign(Zone=None)
+    par_zone = enveloppes(df, ["Code agence", "Zone"], ratio=ratio)
+    return pd.concat([par_agence, par_zone], ignore_index=True)[["Code agence", "Zone", "Nb_localites", "geojson"]]
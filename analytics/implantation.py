@@ -0,0 +1,139 @@
+import numpy as np
+import pandas as pd
+from analytics.geo import haversine_matrix, nearest
+
+MAX_CANDIDATS = 2000  # au-delà : on garde les communes candidates les plus chargées
+MAX_ITERATIONS_ECHANGE = 50
+
+
+def cle_commune(communes):
+    # Clé de jointure entre tables : nom de commune sans espaces superflus, en majuscules
+    return communes.astype(str).str.strip().str.upper()
+
+
+def poids_par_commune(cube, colonne="Nb_exp"):
+    # Volume d'expéditions par commune depuis le cube palette
+    return cube[colonne].groupby(cle_commune(cube["Commune"]).to_numpy()).sum()
+
+
+def demande_communes(df_unique, poids):
+    # Une ligne par commune avec son poids (0 si aucune expédition) et sa distance à l'agence actuelle
+    demande = df_unique[["Commune", "Code agence", "Latitude", "Longitude", "Distance (km)"]].copy()
+    demande["Poids"] = cle_commune(demande["Commune"]).map(poids).fillna(0).to_numpy()
+    return demande
+
+
+def _cout(poids, distances):
+    return float(np.dot(poids, distances))
+
+
+def _gains(poids, courant, D):
+    # Gain (km pondérés) apporté par chaque candidat, vectorisé sur la matrice demande x candidats
+    return poids @ np.maximum(courant[:, None] - D, 0)
+
+
+def _meilleure_distance(dist_actuelle, D, choisis):
+    if not choisis:
+        return dist_actuelle
+    return np.minimum(dist_actuelle, D[:, choisis].min(axis=1))
+
+
+def p_median(poids, dist_actuelle, D, p, max_iterations=MAX_ITERATIONS_ECHANGE):
+    # p-médiane pondérée : p nouveaux sites parmi les candidats (colonnes de D), les agences
+    # existantes restant ouvertes (dist_actuelle). Glouton puis échanges (Teitz-Bart).
+    poids = np.asarray(poids, dtype=D.dtype)
+    dist_actuelle = np.asarray(dist_actuelle, dtype=D.dtype)
+    p = min(p, D.shape[1])
+
+    choisis = []
+    courant = dist_actuelle.copy()
+    for _ in range(p):
+        gains = _gains(poids, courant, D)
+        gains[choisis] = -np.inf
+        j = int(gains.argmax())
+        if gains[j] <= 0:
+            break
+        choisis.append(j)
+        courant = np.minimum(courant, D[:, j])
+
+    cout = _cout(poids, courant)
+    for _ in range(max_iterations):
+        ameliore = False
+        for rang in range(len(choisis)):
+            autres = choisis[:rang] + choisis[rang + 1:]
+            sans = _meilleure_distance(dist_actuelle, D, autres)
+            gains = _gains(poids, sans, D)
+            gains[choisis] = -np.inf
+            j = int(gains.argmax())
+            nouveau_cout = _cout(poids, sans) - gains[j]
+            if nouveau_cout < cout - 1e-6:
+                choisis[rang] = j
+                cout = nouveau_cout
+                ameliore = True
+        if not ameliore:
+            break
+
+    return choisis, _meilleure_distance(dist_actuelle, D, choisis)
+
+
+def distances_agences(demande, agences=None):
+    # Distance de chaque commune à l'agence existante la plus proche (haversine) ;
+    # sans coordonnées d'agences : distance à l'agence d'affectation actuelle
+    if agences is None or agences.empty:
+        return demande["Distance (km)"].to_numpy(dtype=np.float32)
+    _, distances = nearest(
+        demande["Latitude"], demande["Longitude"],
+        agences["Latitude"], agences["Longitude"], dtype=np.float32,
+    )
+    return distances
+
+
+def implanter_agences(demande, p, agences=None, candidats=None, max_candidats=MAX_CANDIDATS):
+    # demande : Commune, Latitude, Longitude, Poids, Distance (km) jusqu'à l'agence actuelle
+    # agences : Latitude, Longitude des agences existantes (référence : agence la plus proche)
+    # Renvoie (sites proposés, affectation des communes, km pondérés économisés)
+    sans_agences = agences is None or agences.empty
+    demande = demande.dropna(subset=["Latitude", "Longitude"] + (["Distance (km)"] if sans_agences else []))
+    demande = demande[demande["Poids"] > 0].reset_index(drop=True)
+    if candidats is None:
+        candidats = demande
+    candidats = (
+        candidats.dropna(subset=["Latitude", "Longitude"])
+                 .nlargest(max_candidats, "Poids")
+                 .reset_index(drop=True)
+    )
+    if demande.empty or candidats.empty:
+        return candidats.iloc[0:0], demande.assign(Site=None), 0.0
+
+    D = haversine_matrix(
+        demande["Latitude"], demande["Longitude"],
+        candidats["Latitude"], candidats["Longitude"], dtype=np.float32,
+    )
+    poids = demande["Poids"].to_numpy(dtype=np.float32)
+    dist_actuelle = distances_agences(demande, agences)
+    choisis, dist_finale = p_median(poids, dist_actuelle, D, p)
+
+    # Affectation : site le plus proche s'il fait mieux que l'agence actuelle
+    affectation = demande.assign(**{
+        "Distance avant (km)": dist_actuelle.round(1),
+        "Distance après (km)": dist_finale.round(1),
+        "Site": None,
+    })
+    if choisis:
+        sous_D = D[:, choisis]
+        plus_proche = sous_D.argmin(axis=1)
+        gagne = sous_D[np.arange(len(demande)), plus_proche] < dist_actuelle
+        noms = candidats["Commune"].to_numpy()[choisis]
+        affectation.loc[gagne, "Site"] = noms[plus_proche[gagne]]
+
+    economies = (dist_actuelle - dist_finale) * poids
+    sites = candidats.loc[choisis, ["Commune", "Latitude", "Longitude"]].reset_index(drop=True)
+    par_site = pd.DataFrame({"Site": affectation["Site"], "Poids": poids, "Économie": economies})
+    par_site = par_site.dropna(subset=["Site"]).groupby("Site").agg(
+        Communes_desservies=("Poids", "size"),
+        Expeditions_desservies=("Poids", "sum"),
+        Km_ponderes_economises=("Économie", "sum"),
+    )
+    sites = sites.join(par_site, on="Commune").fillna(0)
+    sites["Km_ponderes_economises"] = sites["Km_ponderes_economises"].round(1)
+    return sites, affectation, float(economies.sum())
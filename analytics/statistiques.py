@@ -0,0 +1,66 @@
+import pandas as pd
+
+
+def filtrer(df, zone="Toutes", agence="Toutes"):
+    # Filtre zone / agence des pages d'analyse ("Toutes" : pas de filtre), sans copie préalable
+    masque = pd.Series(True, index=df.index)
+    if zone != "Toutes":
+        masque &= df["Zone"] == zone
+    if agence != "Toutes" and "Code agence" in df.columns:
+        masque &= df["Code agence"] == agence
+    return df[masque]
+
+
+def _dimensions(df, colonnes=("Code agence", "Zone", "Commune")):
+    return [c for c in colonnes if c in df.columns]
+
+
+def totaux(df, colonne, valeur, nom=None):
+    # Somme de `valeur` par modalité de `colonne`, prête pour un camembert
+    return df.groupby(colonne, observed=True)[valeur].sum().reset_index(name=nom or valeur)
+
+
+def top_communes(detail, n=20):
+    return detail.groupby("Commune", observed=True)["Nb_expéditions"].sum().nlargest(n).reset_index()
+
+
+# === Cube poids (page 2)
+def detail_poids(cube):
+    # Détail agence x zone x commune depuis le cube agence x zone x commune x tranche
+    mesures = ["Nb_exp", "Poids_total"] + (["UM_total"] if "UM_total" in cube.columns else [])
+    detail = cube.groupby(_dimensions(cube), observed=True)[mesures].sum()
+    detail.columns = ["Nb_expéditions"] + mesures[1:]
+    return detail.reset_index().round(2)
+
+
+def stats_poids(cube, colonne):
+    agg = cube.groupby(colonne, observed=True)[["Nb_exp", "Poids_total", "UM_total", "UM_nb"]].sum()
+    return pd.DataFrame({
+        "Exp_total": agg["Nb_exp"],
+        "Poids_total": agg["Poids_total"],
+        "UM_total": agg["UM_total"],
+        "Poids_moyen": agg["Poids_total"] / agg["Nb_exp"],
+        "UM_moyenne": agg["UM_total"] / agg["UM_nb"],
+    }).round(2)
+
+
+# === Cube palette (page 4)
+def stats_palette(cube, colonnes):
+    agg = cube.groupby(colonnes, observed=True)[["Nb_exp", "UM_total"]].sum()
+    return pd.DataFrame({
+        "Nb_expéditions": agg["Nb_exp"],
+        "UM_total": agg["UM_total"],
+        "UM_moyenne": agg["UM_total"] / agg["Nb_exp"],
+    }).round(2)
+
+
+def detail_palette(cube):
+    return stats_palette(cube, _dimensions(cube)).reset_index()
+
+
+def comptages(cube, colonne, trier=False):
+    # Nombre d'expéditions par modalité (colonnes : colonne, Nb_exp), du plus fréquent au moins fréquent ;
+    # comme value_counts, les catégories sans expédition sont gardées (observed=False)
+    nb = cube.groupby(colonne, observed=False)["Nb_exp"].sum()
+    nb = nb.sort_index() if trier else nb.sort_values(ascending=False, kind="stable")
+    return nb.reset_index(name="Nb_exp")
@@ -0,0 +1,62 @@
+import pandas as pd
+
+from analytics.geo import build_agence_index, k_nearest_agences
+
+SEUIL_ELOIGNEMENT_KM = 40
+SEUIL_NB_EXP = 3
+
+
+def expeditions_par_commune(df):
+    # Nombre de lignes par commune, puis une ligne par commune
+    df = df.assign(Nb_expéditions=df.groupby("Commune", observed=True)["Commune"].transform("count"))
+    return df, df.drop_duplicates(subset=["Commune"]).copy()
+
+
+def localites_eloignees(df, seuil=SEUIL_ELOIGNEMENT_KM):
+    return df[df["Distance (km)"] > seuil].sort_values(by="Distance (km)", ascending=False)
+
+
+def clusters_eloignes(df_unique, seuil_distance=SEUIL_ELOIGNEMENT_KM, seuil_nb_exp=SEUIL_NB_EXP):
+    # Clusters contenant des communes à la fois éloignées et à fort volume
+    return df_unique[
+        (df_unique["Distance (km)"] > seuil_distance) & (df_unique["Nb_expéditions"] > seuil_nb_exp)
+    ]["Cluster"].unique()
+
+
+def coordonnees_agences(df_coords, df):
+    # Coordonnées exactes des agences (cordonnee_agence), sinon moyenne des coordonnées agence des localités
+    if not df_coords.empty and {"Code agence", "Latitude", "Longitude"} <= set(df_coords.columns):
+        return df_coords.dropna(subset=["Latitude", "Longitude"])[["Code agence", "Latitude", "Longitude"]]
+    return (
+        df.dropna(subset=["Latitude_agence", "Longitude_agence"])
+          .groupby("Code agence", observed=True)[["Latitude_agence", "Longitude_agence"]]
+          .mean()
+          .reset_index()
+          .rename(columns={"Latitude_agence": "Latitude", "Longitude_agence": "Longitude"})
+    )
+
+
+def suggestions_reaffectation(df_candidats, agences_data, k=1):
+    # k agences les plus proches de chaque localité : une seule requête sur l'index spatial.
+    # Suggestion si l'agence la plus proche n'est pas l'agence actuelle et fait mieux qu'elle.
+    index_agences = build_agence_index(agences_data["Code agence"], agences_data["Latitude"], agences_data["Longitude"])
+    codes_proches, dist_proches = k_nearest_agences(
+        index_agences, df_candidats["Latitude"], df_candidats["Longitude"], k=k
+    )
+
+    dist_actuelle = df_candidats["Distance (km)"].to_numpy(dtype=float)
+    agence_actuelle = df_candidats["Code agence"].to_numpy()
+    agence_proche, dist_proche = codes_proches[:, 0], dist_proches[:, 0]
+    a_reaffecter = (dist_proche < dist_actuelle) & (agence_proche != agence_actuelle)
+
+    suggestions = pd.DataFrame({
+        "Commune": df_candidats["Commune"].to_numpy()[a_reaffecter],
+        "Agence actuelle": agence_actuelle[a_reaffecter],
+        "Agence suggérée": agence_proche[a_reaffecter],
+        "Distance actuelle (km)": dist_actuelle[a_reaffecter].round(1),
+        "Distance suggérée (km)": dist_proche[a_reaffecter].round(1),
+    })
+    for rang in range(1, codes_proches.shape[1]):
+        suggestions[f"Alternative {rang}"] = codes_proches[a_reaffecter, rang]
+        suggestions[f"Distance alternative {rang} (km)"] = dist_proches[a_reaffecter, rang].round(1)
+    return suggestions
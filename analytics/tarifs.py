@@ -0,0 +1,106 @@
+import numpy as np
+import pandas as pd
+
+from analytics.tranches import crosstab, repartitions
+
+ZONES = ["Zone 1", "Zone 2", "Zone 3"]
+
+
+def _matrices(repartition, forfaits):
+    # repartition : DataFrame (tranches x zones, en %) ; forfaits : dict ou Series par tranche
+    r = repartition[ZONES].to_numpy(dtype=float) / 100
+    f = pd.Series(forfaits).reindex(repartition.index).to_numpy(dtype=float)
+    return r, f
+
+
+def _grille_tarifs(r, f, a, coefs):
+    # a : (P,) ; coefs : (P, 3) -> tarifs par zone (P, T, 3) et total pondéré (P, T)
+    x = f[None, :] - a[:, None] * (coefs @ r.T)
+    z = np.round(x[:, :, None] + a[:, None, None] * coefs[:, None, :], 2)
+    total = np.round((r[None, :, :] * z).sum(axis=2), 2)
+    return z, total
+
+
+def coefficients_racine(distances):
+    # Coefficient de zone proportionnel à la racine de la distance moyenne, Zone 1 = 1
+    base = np.sqrt(distances[ZONES[0]])
+    return {zone: float(np.sqrt(d) / base) for zone, d in distances.items()}
+
+
+def calculer_tarifs(repartition, forfaits, a, coef_zone1, coef_zone2, coef_zone3):
+    # Tarif zone k = forfait - a * Σ(coef_j * r_j) + coef_k * a, pour toutes les tranches à la fois
+    r, f = _matrices(repartition, forfaits)
+    z, total = _grille_tarifs(r, f, np.array([a], dtype=float),
+                              np.array([[coef_zone1, coef_zone2, coef_zone3]], dtype=float))
+    return pd.DataFrame({
+        "Tranche": repartition.index,
+        "Zone 1 (€)": z[0, :, 0],
+        "Zone 2 (€)": z[0, :, 1],
+        "Zone 3 (€)": z[0, :, 2],
+        "Total pondéré (€)": total[0],
+    })
+
+
+def balayage_tarifs(repartition, forfaits, tarifs_actuels, ecarts, coefs_zone2, coefs_zone3, coef_zone1=0.0,
+                    volumes=None):
+    # Évalue toute la grille (écart fixe x coef zone 2 x coef zone 3) en une opération matricielle.
+    # Chaque grille rend le forfait sur `repartition` (Σr = 1) : elle est notée sur son écart aux tarifs
+    # actuels (DataFrame indexé par tranche, colonnes "Zone k (€)"), pondéré par la part de chaque zone.
+    # Renvoie (cube, synthese) :
+    #  - cube : une ligne par combinaison et tranche (tarifs par zone, total pondéré, écart aux tarifs actuels)
+    #  - synthese : une ligne par combinaison, écart moyen pondéré par le volume de chaque tranche
+    r, f = _matrices(repartition, forfaits)
+    actuels = tarifs_actuels.reindex(repartition.index)[[f"{zone} (€)" for zone in ZONES]].to_numpy(dtype=float)
+    a, c2, c3 = (g.ravel() for g in np.meshgrid(
+        np.asarray(ecarts, dtype=float), np.asarray(coefs_zone2, dtype=float),
+        np.asarray(coefs_zone3, dtype=float), indexing="ij",
+    ))
+    coefs = np.column_stack([np.full_like(a, coef_zone1), c2, c3])
+    z, total = _grille_tarifs(r, f, a, coefs)
+    ecarts_zones = np.abs(z - actuels[None, :, :])
+    ecart = (r[None, :, :] * ecarts_zones).sum(axis=2)
+
+    w = np.ones(len(f)) if volumes is None else pd.Series(volumes).reindex(repartition.index).fillna(0).to_numpy(dtype=float)
+    w = w / w.sum() if w.sum() else w
+
+    n_params, n_tranches = total.shape
+    cube = pd.DataFrame({
+        "Écart fixe (€)": np.repeat(a, n_tranches),
+        "Coef Zone 2": np.repeat(c2, n_tranches),
+        "Coef Zone 3": np.repeat(c3, n_tranches),
+        "Tranche": np.tile(np.asarray(repartition.index), n_params),
+        "Zone 1 (€)": z[:, :, 0].ravel(),
+        "Zone 2 (€)": z[:, :, 1].ravel(),
+        "Zone 3 (€)": z[:, :, 2].ravel(),
+        "Total pondéré (€)": total.ravel(),
+        "Écart aux tarifs actuels (€)": ecart.ravel().round(2),
+    })
+    synthese = pd.DataFrame({
+        "Écart fixe (€)": a,
+        "Coef Zone 2": c2,
+        "Coef Zone 3": c3,
+        "Écart moyen aux tarifs actuels (€)": (ecart * w[None, :]).sum(axis=1).round(4),
+        "Écart max (€)": ecarts_zones.max(axis=(1, 2)).round(2),
+    })
+    return cube, synthese
+
+
+def repartition_depuis_cube(cube, colonne_tranche, agence=None, libelles_tranches=None, reference=None):
+    # Répartition (%) des zones par tranche et volume par tranche, calculées sur les expéditions réelles.
+    # Les tranches sans expédition reprennent la répartition de référence si elle est fournie.
+    if agence is not None and "Code agence" in cube.columns:
+        cube = cube[cube["Code agence"] == agence]
+    matrice = crosstab(cube[colonne_tranche], cube["Zone"], poids=cube["Nb_exp"])
+    matrice = matrice.reindex(columns=ZONES, fill_value=0)
+
+    repartition = repartitions(matrice)["lignes"]
+    volumes = matrice.sum(axis=1)
+    if libelles_tranches is not None:
+        repartition = repartition.rename(index=libelles_tranches)
+        volumes = volumes.rename(index=libelles_tranches)
+    repartition.index.name = "Tranche de poids"
+
+    if reference is not None:
+        vides = volumes.index[volumes == 0]
+        repartition.loc[vides, ZONES] = reference.loc[vides, ZONES].to_numpy()
+    return repartition, volumes
@@ -0,0 +1,129 @@
+import numpy as np
+import pandas as pd
+
+# === Tranches de poids (kg)
+BINS_POIDS = [0, 10, 20, 30, 40, 50, 60, 70, 80, 90, 100, 200, 300, 500, 700, 1000, 1500, 2000, 3000]
+LABELS_POIDS = [
+    "10", "20", "30", "40", "50",
+    "60", "70", "80", "90", "100",
+    "200", "300", "500", "700",
+    "1000", "1500", "2000", "3000"
+]
+
+# === Tranches de palettes (UM)
+BINS_UM = [0, 1, 2, 3, 4, 5, 6, float("inf")]
+LABELS_UM = ["1 palette", "2 palettes", "3 palettes", "4 palettes", "5 palettes", "6 palettes", "+6 palettes"]
+
+
+def nombre_fr(serie):
+    # "12,5" -> 12.5
+    if pd.api.types.is_numeric_dtype(serie):
+        return serie.astype(float)
+    return serie.astype(str).str.replace(",", ".").astype(float)
+
+
+def libelles(serie):
+    # Libellés nettoyés ; une colonne catégorielle (déjà nettoyée à l'import) est gardée telle quelle
+    if isinstance(serie.dtype, pd.CategoricalDtype):
+        return serie
+    return serie.astype(str).str.strip()
+
+
+def _categories_presentes(cube, dims):
+    # Libellés catégoriels (table typée) : seules les valeurs présentes dans le cube sont gardées
+    for col in dims:
+        if isinstance(cube[col].dtype, pd.CategoricalDtype) and not cube[col].cat.ordered:
+            cube[col] = cube[col].cat.remove_unused_categories()
+    return cube
+
+
+def preparer_poids(df):
+    # Nettoyage + affectation de la tranche de poids ; lignes hors tranche écartées
+    df = df.rename(columns=lambda c: str(c).strip())
+    df["Poids"] = nombre_fr(df["Poids"])
+    df["Zone"] = libelles(df["Zone"])
+    if "UM" in df.columns:
+        df["UM"] = nombre_fr(df["UM"])
+    df["Tranche"] = pd.cut(df["Poids"], bins=BINS_POIDS, labels=LABELS_POIDS, right=False)
+    return df[df["Tranche"].notna()]
+
+
+def cube_poids(df):
+    # Cube agence x zone x commune x tranche -> nb expéditions, poids total, UM total
+    df = preparer_poids(df)
+    dims = (["Code agence"] if "Code agence" in df.columns else []) + ["Zone", "Commune", "Tranche"]
+    mesures = {"Nb_exp": ("Poids", "size"), "Poids_total": ("Poids", "sum")}
+    if "UM" in df.columns:
+        mesures["UM_total"] = ("UM", "sum")
+        mesures["UM_nb"] = ("UM", "count")
+    cube = df.groupby(dims, observed=True, dropna=False).agg(**mesures).reset_index()
+    cube["Tranche"] = pd.Categorical(cube["Tranche"], categories=LABELS_POIDS, ordered=True)
+    return _categories_presentes(cube, dims)
+
+
+def preparer_palette(df):
+    # Nettoyage + affectation de la tranche de palettes ; lignes hors tranche écartées
+    df = df.rename(columns=lambda c: str(c).strip())
+    df["UM"] = nombre_fr(df["UM"])
+    df["Zone"] = libelles(df["Zone"])
+    if "Code agence" in df.columns:
+        df["Code agence"] = libelles(df["Code agence"])
+    df["Tranche_UM"] = pd.cut(df["UM"], bins=BINS_UM, labels=LABELS_UM, right=True)
+    df["Tranche_UM"] = pd.Categorical(df["Tranche_UM"], categories=LABELS_UM, ordered=True)
+    return df[df["Tranche_UM"].notna()]
+
+
+def cube_palette(df):
+    # Cube agence x zone x commune x tranche UM -> nb expéditions, UM total
+    df = preparer_palette(df)
+    dims = [c for c in ["Code agence", "Zone", "Commune"] if c in df.columns] + ["Tranche_UM"]
+    cube = df.groupby(dims, observed=True, dropna=False).agg(
+        Nb_exp=("UM", "size"), UM_total=("UM", "sum")
+    ).reset_index()
+    cube["Tranche_UM"] = pd.Categorical(cube["Tranche_UM"], categories=LABELS_UM, ordered=True)
+    return _categories_presentes(cube, dims)
+
+
+def _codes(valeurs):
+    # Codes entiers + libellés ; catégories ordonnées (tranches) toutes conservées, sinon valeurs triées ; NaN -> -1
+    if isinstance(valeurs.dtype, pd.CategoricalDtype) and valeurs.cat.ordered:
+        return valeurs.cat.codes.to_numpy(), valeurs.cat.categories
+    codes, labels = pd.factorize(valeurs, sort=True)
+    return codes, labels
+
+
+def crosstab(lignes, colonnes, poids=None):
+    # Matrice de comptage (ou somme de `poids`) en un seul passage np.bincount
+    r, r_labels = _codes(pd.Series(lignes))
+    c, c_labels = _codes(pd.Series(colonnes))
+    valides = (r >= 0) & (c >= 0)
+    w = None if poids is None else np.asarray(poids, dtype=float)[valides]
+    nr, nc = len(r_labels), len(c_labels)
+    flat = np.bincount(r[valides] * nc + c[valides], weights=w, minlength=nr * nc)
+    return pd.DataFrame(
+        flat.reshape(nr, nc),
+        index=pd.Index(r_labels, name=getattr(lignes, "name", None)),
+        columns=pd.Index(c_labels, name=getattr(colonnes, "name", None)),
+    )
+
+
+def repartitions(matrice, decimales=2):
+    # Toutes les distributions (%) dérivées d'une même matrice de comptage
+    m = matrice.to_numpy(dtype=float)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        par_ligne = m / m.sum(axis=1, keepdims=True) * 100
+        par_colonne = m / m.sum(axis=0, keepdims=True) * 100
+        total = m / m.sum() * 100
+        marge_colonnes = m.sum(axis=0) / m.sum() * 100
+        marge_lignes = m.sum(axis=1) / m.sum() * 100
+
+    def cadre(values):
+        return pd.DataFrame(np.nan_to_num(values), index=matrice.index, columns=matrice.columns).round(decimales)
+
+    return {
+        "lignes": cadre(par_ligne),
+        "colonnes": cadre(par_colonne),
+        "total": cadre(total),
+        "marge_colonnes": pd.Series(np.nan_to_num(marge_colonnes), index=matrice.columns).round(decimales),
+        "marge_lignes": pd.Series(np.nan_to_num(marge_lignes), index=matrice.index).round(decimales),
+    }
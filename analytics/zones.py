@@ -0,0 +1,56 @@
+import pandas as pd
+
+ZONES = ["Zone 1", "Zone 2", "Zone 3"]
+SEUILS_SUGGESTION = (20, 40)  # km : Zone 1 <= 20 < Zone 2 <= 40 < Zone 3
+
+
+def zone_suggeree(distance):
+    if distance <= SEUILS_SUGGESTION[0]:
+        return "Zone 1"
+    if distance <= SEUILS_SUGGESTION[1]:
+        return "Zone 2"
+    return "Zone 3"
+
+
+def coordonnees_agence(df, code_agence):
+    # Coordonnées moyennes de l'agence relevées sur ses localités ; IndexError si l'agence est absente
+    lignes = df.loc[df["Code agence"] == code_agence, ["Latitude_agence", "Longitude_agence"]]
+    if lignes.empty:
+        raise IndexError(code_agence)
+    coord = lignes.mean()
+    return float(coord["Latitude_agence"]), float(coord["Longitude_agence"])
+
+
+def comptage_zones(df):
+    return df["Zone"].value_counts().reindex(ZONES, fill_value=0)
+
+
+def distances_par_zone(df):
+    return (
+        df.groupby("Zone", observed=True)["Distance (km)"]
+        .agg(["count", "mean"])
+        .rename(columns={"count": "Nb localités", "mean": "Distance moyenne (km)"})
+        .round(2)
+    )
+
+
+def resumes_agences(df_nv, df_old):
+    # Localités de toutes les agences (nouvelle + existantes) et résumés vectorisés :
+    #  - par agence : nb localités, nb par zone, distance moyenne
+    #  - par agence x zone : nb localités, distance moyenne
+    df_old = df_old.dropna(subset=["Code agence"])
+    df_agences = pd.concat([df_nv, df_old.assign(Agence=df_old["Code agence"].astype(str))], ignore_index=True)
+
+    par_agence = df_agences.groupby("Agence", observed=True).agg(Localités=("Commune", "count"))
+    nb_zones = (
+        df_agences.groupby(["Agence", "Zone"], observed=True).size()
+        .unstack("Zone", fill_value=0)
+        .reindex(columns=ZONES, fill_value=0)
+    )
+    par_agence[[z.replace(" ", "_") for z in ZONES]] = nb_zones.reindex(par_agence.index, fill_value=0).to_numpy()
+
+    par_zone = df_agences.groupby(["Agence", "Zone"], observed=True).agg(Localités=("Commune", "size"))
+    if "Distance (km)" in df_agences.columns:
+        par_agence["Distance_moyenne"] = df_agences.groupby("Agence", observed=True)["Distance (km)"].mean()
+        par_zone["Distance (km)"] = df_agences.groupby(["Agence", "Zone"], observed=True)["Distance (km)"].mean()
+    return df_agences, par_agence.round(2), par_zone.reset_index()
@@ -0,0 +1,251 @@
+import argparse
+import gc
+import io
+import json
+import platform
+import statistics
+import subprocess
+import time
+import tracemalloc
+from datetime import datetime
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import sklearn
+
+from donnees_synthetiques import jeu_de_donnees, format_base, NB_EXPEDITIONS
+from analytics.tranches import cube_poids, cube_palette, preparer_palette, crosstab, repartitions, LABELS_UM
+from analytics.tarifs import calculer_tarifs, balayage_tarifs, repartition_depuis_cube
+from analytics.geo import build_agence_index, k_nearest_agences, enveloppes_agences
+from analytics.clustering import ajuster_plage
+from analytics.implantation import implanter_agences
+from cartes import carte_comparaison
+from ingestion import (
+    lire_csv, compacter, empreinte_memoire, COLONNES_EXPEDITIONS, NUMERIQUES_EXPEDITIONS, CATEGORIES_EXPEDITIONS,
+    NUMERIQUES_TABLES_EXPEDITIONS, CATEGORIES_TABLES_EXPEDITIONS,
+)
+
+# Usage :
+#   python benchmark.py                                   # échelles 1x, 10x, 100x
+#   python benchmark.py --echelles 1 10 100 1000 --json bench.json
+#   python benchmark.py --comparer bench.json > bench_output.txt
+#   python benchmark.py --memoire --echelles 1 100         # empreinte de pal_tranche avant / après typage
+
+ECHELLES = [1, 10, 100]
+REPETITIONS = 3
+GRAINE = 0
+
+# Paramètres fixes des calculs mesurés (ceux des pages par défaut)
+TRANCHES_TARIF = ["1 P", "2 P", "3 P", "4 P", "5 P", "6 P", "P sup"]
+FORFAITS = {"1 P": 34.00, "2 P": 54.00, "3 P": 69.00, "4 P": 83.00, "5 P": 97.00, "6 P": 111.00, "P sup": 9.60}
+GRILLE = np.linspace(1.0, 4.0, 15)
+
+
+# === Calculs mesurés : fonction(jeu) -> (calcul sans argument, nb lignes traitées)
+def bench_lecture_csv(jeu):
+    contenu = format_base(jeu["expeditions"]).to_csv(sep=";", index=False).encode("latin1")
+    calcul = lambda: lire_csv(  # noqa: E731
+        io.BytesIO(contenu), colonnes=COLONNES_EXPEDITIONS,
+        numeriques=NUMERIQUES_EXPEDITIONS, categories=CATEGORIES_EXPEDITIONS, max_memoire_mo=16_384,
+    )
+    return calcul, len(jeu["expeditions"])
+
+
+def bench_cube_poids(jeu):
+    df = format_base(jeu["expeditions"])
+    return lambda: cube_poids(df), len(df)
+
+
+def bench_crosstab_palette(jeu):
+    df = format_base(jeu["expeditions"])
+
+    def calcul():
+        palette = preparer_palette(df)
+        return repartitions(crosstab(palette["Zone"], palette["Tranche_UM"]))
+    return calcul, len(df)
+
+
+def bench_tarifs(jeu):
+    cube = cube_palette(format_base(jeu["expeditions"]))
+    libelles = dict(zip(LABELS_UM, TRANCHES_TARIF))
+
+    def calcul():
+        repartition, volumes = repartition_depuis_cube(cube, "Tranche_UM", libelles_tranches=libelles)
+        calculer_tarifs(repartition, FORFAITS, 2.77, 0.0, 1.732, 2.236)
+        return balayage_tarifs(repartition, FORFAITS, GRILLE, GRILLE, GRILLE, volumes=volumes)
+    return calcul, len(cube)
+
+
+def bench_reaffectation(jeu):
+    agences, localites = jeu["agences"], jeu["localites"]
+
+    def calcul():
+        index = build_agence_index(agences["Code agence"], agences["Latitude"], agences["Longitude"])
+        return k_nearest_agences(index, localites["Latitude"], localites["Longitude"], k=3)
+    return calcul, len(localites)
+
+
+def _communes(jeu):
+    nb = format_base(jeu["expeditions"])["Commune"].value_counts()
+    communes = jeu["localites"].copy()
+    communes["Nb_expéditions"] = communes["Commune"].map(nb).fillna(0).to_numpy()
+    return communes
+
+
+def bench_clustering(jeu):
+    X = _communes(jeu)[["Distance (km)", "Nb_expéditions"]].to_numpy(dtype=float)
+    return lambda: ajuster_plage(X), len(X)
+
+
+def bench_implantation(jeu):
+    demande = _communes(jeu).rename(columns={"Nb_expéditions": "Poids"})
+    return lambda: implanter_agences(demande, 3), len(demande)
+
+
+def bench_enveloppes(jeu):
+    localites = jeu["localites"]
+    return lambda: enveloppes_agences(localites), len(localites)
+
+
+def bench_carte(jeu):
+    agences = jeu["agences"]
+    df_all = jeu["localites"].assign(Agence=jeu["localites"]["Code agence"])
+    codes = list(agences["Code agence"])
+    coords = agences.set_index("Code agence")[["Latitude", "Longitude"]].to_dict("index")
+    enveloppes = enveloppes_agences(jeu["localites"])
+
+    def calcul():
+        return carte_comparaison(df_all, codes, coords, codes, enveloppes, points=True).get_root().render()
+    return calcul, len(df_all)
+
+
+# nom -> (préparation, échelle maximale raisonnable : au-delà le calcul est ignoré)
+BENCHMARKS = {
+    "lecture_csv": (bench_lecture_csv, 100),
+    "tranches_poids": (bench_cube_poids, 1000),
+    "crosstab_palette": (bench_crosstab_palette, 1000),
+    "tarifs": (bench_tarifs, 1000),
+    "reaffectation": (bench_reaffectation, 1000),
+    "clustering": (bench_clustering, 100),
+    "implantation": (bench_implantation, 10),  # matrice demande x 2000 candidats
+    "enveloppes": (bench_enveloppes, 100),
+    "carte": (bench_carte, 10),  # HTML proportionnel au nombre de points
+}
+
+
+def mesurer(calcul, repetitions=REPETITIONS):
+    # Un passage sous tracemalloc pour le pic mémoire, puis `repetitions` passages chronométrés
+    gc.collect()
+    tracemalloc.start()
+    calcul()
+    _, pic = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    durees = []
+    for _ in range(repetitions):
+        gc.collect()
+        debut = time.perf_counter()
+        calcul()
+        durees.append(time.perf_counter() - debut)
+    return {"min_s": min(durees), "mediane_s": statistics.median(durees), "pic_memoire_mo": pic / 1024 ** 2}
+
+
+def environnement():
+    try:
+        commit = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True,
+            cwd=Path(__file__).resolve().parent,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {
+        "date": datetime.now().isoformat(timespec="seconds"),
+        "commit": commit,
+        "python": platform.python_version(),
+        "plateforme": platform.platform(),
+        "numpy": np.__version__,
+        "pandas": pd.__version__,
+        "sklearn": sklearn.__version__,
+        "graine": GRAINE,
+    }
+
+
+def executer(echelles=ECHELLES, noms=None, repetitions=REPETITIONS):
+    resultats = []
+    for echelle in echelles:
+        jeu = jeu_de_donnees(echelle, GRAINE)
+        for nom, (preparer, echelle_max) in BENCHMARKS.items():
+            if noms and nom not in noms:
+                continue
+            if echelle > echelle_max:
+                print(f"{nom:<18} {echelle:>5}x  ignoré (échelle max {echelle_max}x)")
+                continue
+            calcul, lignes = preparer(jeu)
+            mesure = mesurer(calcul, repetitions)
+            resultats.append({"benchmark": nom, "echelle": echelle, "lignes": lignes, **mesure})
+            print(f"{nom:<18} {echelle:>5}x  {lignes:>10} lignes  {mesure['mediane_s']:8.3f} s"
+                  f"  {mesure['pic_memoire_mo']:8.1f} Mo", flush=True)
+        del jeu
+    return pd.DataFrame(resultats)
+
+
+def memoire_pal_tranche(echelle):
+    # pal_tranche telle que renvoyée par pd.read_sql (libellés en texte), puis typée comme dans database.load_table
+    brute = format_base(jeu_de_donnees(echelle, GRAINE)["expeditions"])
+    brute = brute.astype({c: str for c in brute.columns if isinstance(brute[c].dtype, pd.CategoricalDtype)})
+    typee = compacter(brute.copy(), NUMERIQUES_TABLES_EXPEDITIONS, CATEGORIES_TABLES_EXPEDITIONS)
+    return empreinte_memoire(brute, typee)
+
+
+def rapport(resultats, reference=None):
+    # Tableau texte ; avec une référence, ratio de durée et de mémoire (< 1 : plus rapide / plus sobre)
+    tableau = resultats.copy()
+    tableau["lignes/s"] = (tableau["lignes"] / tableau["mediane_s"]).round(0)
+    if reference is not None:
+        tableau = tableau.merge(
+            reference[["benchmark", "echelle", "mediane_s", "pic_memoire_mo"]],
+            on=["benchmark", "echelle"], how="left", suffixes=("", "_ref"),
+        )
+        tableau["ratio_duree"] = (tableau["mediane_s"] / tableau["mediane_s_ref"]).round(2)
+        tableau["ratio_memoire"] = (tableau["pic_memoire_mo"] / tableau["pic_memoire_mo_ref"]).round(2)
+        tableau = tableau.drop(columns=["mediane_s_ref", "pic_memoire_mo_ref"])
+    return tableau.round({"min_s": 4, "mediane_s": 4, "pic_memoire_mo": 1}).to_string(index=False)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmarks des calculs Normatrans sur données synthétiques")
+    parser.add_argument("--echelles", type=int, nargs="+", default=ECHELLES)
+    parser.add_argument("--benchmarks", nargs="+", choices=list(BENCHMARKS), default=None)
+    parser.add_argument("--repetitions", type=int, default=REPETITIONS)
+    parser.add_argument("--json", help="enregistre les résultats (et l'environnement) dans ce fichier")
+    parser.add_argument("--comparer", help="résultats JSON d'une version précédente")
+    parser.add_argument("--memoire", action="store_true", help="empreinte mémoire de pal_tranche avant / après typage")
+    args = parser.parse_args()
+
+    if args.memoire:
+        for echelle in args.echelles:
+            print(f"\n=== pal_tranche {echelle}x — {NB_EXPEDITIONS * echelle} lignes — pandas {pd.__version__}")
+            print(memoire_pal_tranche(echelle).to_string())
+        return
+
+    env = environnement()
+    resultats = executer(args.echelles, args.benchmarks, args.repetitions)
+
+    reference = None
+    if args.comparer:
+        with open(args.comparer, encoding="utf-8") as f:
+            precedent = json.load(f)
+        reference = pd.DataFrame(precedent["resultats"])
+        print(f"\nRéférence : commit {precedent['environnement'].get('commit')} du {precedent['environnement']['date']}")
+
+    print(f"\n=== Benchmarks — commit {env['commit']} — Python {env['python']}, pandas {env['pandas']}, numpy {env['numpy']}")
+    print(rapport(resultats, reference))
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump({"environnement": env, "resultats": resultats.to_dict("records")}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,156 @@
+import json
+
+import folium
+from folium.plugins import Search
+
+ZONE_COLORS = {"Zone 1": "green", "Zone 2": "orange", "Zone 3": "red"}
+
+
+def geojson_localites(df, label_col="Commune", zone_col="Zone", popup_col=None):
+    # FeatureCollection de points construite à partir des colonnes (pas d'iterrows)
+    df = df.dropna(subset=["Latitude", "Longitude"])
+    lat = df["Latitude"].to_numpy(dtype=float).round(6).tolist()
+    lon = df["Longitude"].to_numpy(dtype=float).round(6).tolist()
+    labels = df[label_col].astype(str).tolist()
+    zones = df[zone_col].astype(str).tolist() if zone_col in df.columns else ["" for _ in labels]
+    couleurs = [ZONE_COLORS.get(z, "gray") for z in zones]
+
+    features = [
+        {
+            "type": "Feature",
+            "geometry": {"type": "Point", "coordinates": [x, y]},
+            "properties": {label_col: l, "Zone": z, "couleur": c},
+        }
+        for x, y, l, z, c in zip(lon, lat, labels, zones, couleurs)
+    ]
+    # Popup distinct du libellé seulement si demandé (allège le JSON)
+    if popup_col:
+        for feature, p in zip(features, df[popup_col].astype(str).tolist()):
+            feature["properties"]["popup"] = p
+    return {"type": "FeatureCollection", "features": features}
+
+
+def couche_localites(data, name="Localités", radius=5, label_col="Commune"):
+    # Une seule couche GeoJson (marqueurs cercle colorés par zone) au lieu d'un CircleMarker par ligne
+    features = data["features"]
+    champ_popup = "popup" if features and "popup" in features[0]["properties"] else label_col
+    return folium.GeoJson(
+        data,
+        name=name,
+        marker=folium.CircleMarker(radius=radius, fill=True, fill_opacity=0.7),
+        style_function=lambda f: {"color": f["properties"]["couleur"], "fillColor": f["properties"]["couleur"]},
+        tooltip=folium.GeoJsonTooltip(fields=[label_col], labels=False),
+        popup=folium.GeoJsonPopup(fields=[champ_popup], labels=False),
+    )
+
+
+def couche_enveloppes(df_enveloppes, name="Zones (polygones)", couleur_contour=None):
+    # Polygones de couverture : remplis par zone, simple contour pour l'enveloppe d'agence (Zone vide)
+    features = []
+    for agence, zone, nb, geometrie in zip(
+        df_enveloppes["Code agence"], df_enveloppes["Zone"], df_enveloppes["Nb_localites"], df_enveloppes["geojson"]
+    ):
+        zone = zone if isinstance(zone, str) else ""
+        features.append({
+            "type": "Feature",
+            "geometry": json.loads(geometrie),
+            "properties": {
+                "Agence": str(agence), "Zone": zone or "Toutes zones", "Localités": int(nb),
+                "couleur": ZONE_COLORS.get(zone, couleur_contour or "blue"), "remplie": bool(zone),
+            },
+        })
+    return folium.GeoJson(
+        {"type": "FeatureCollection", "features": features},
+        name=name,
+        style_function=lambda f: {
+            "color": f["properties"]["couleur"],
+            "weight": 2 if f["properties"]["remplie"] else 3,
+            "dashArray": None if f["properties"]["remplie"] else "6 4",
+            "fillOpacity": 0.25 if f["properties"]["remplie"] else 0,
+        },
+        tooltip=folium.GeoJsonTooltip(fields=["Agence", "Zone", "Localités"]),
+    )
+
+
+def carte_agence(df_agence, agence, lat_ag, lon_ag, df_enveloppes=None, points=True):
+    # Carte d'une agence : marqueur agence + polygones de zones et/ou localités colorées par zone
+    m = folium.Map(location=[lat_ag, lon_ag], zoom_start=9)
+
+    if df_enveloppes is not None and len(df_enveloppes) > 0:
+        couche_enveloppes(df_enveloppes).add_to(m)
+
+    folium.CircleMarker(
+        location=[lat_ag, lon_ag],
+        radius=8, color="black", fill=True, fill_opacity=1.0,
+        popup=f"Agence : {agence}"
+    ).add_to(m)
+
+    if points:
+        localites_group = couche_localites(geojson_localites(df_agence), name="Localités")
+        localites_group.add_to(m)
+
+        Search(
+            layer=localites_group,
+            search_label="Commune",
+            placeholder="🔍 Chercher une localité...",
+            collapsed=False
+        ).add_to(m)
+    return m
+
+
+def carte_comparaison(df_all, agences, coords_agences, codes_agences, df_enveloppes=None, points=True):
+    # Carte multi-agences : un marqueur par agence, polygones de couverture et/ou couche de localités
+    m = folium.Map(
+        location=[df_all["Latitude"].mean(), df_all["Longitude"].mean()],
+        zoom_start=8
+    )
+
+    # couleurs pour les marqueurs d'agences
+    colors_agences = {"Nouvelle Agence": "blue"}
+    for idx, code in enumerate(codes_agences):
+        colors_agences[code] = ["green", "orange", "purple", "red", "gray"][idx % 5]
+
+    groups = {}
+    for agence in agences:
+        subset = df_all[df_all["Agence"] == agence]
+
+        # 📍 Marqueur agence (coordonnées exactes si connues)
+        if agence == "Nouvelle Agence":
+            lat_ag, lon_ag = coords_agences.get("NT50X", {"Latitude": subset["Latitude"].mean(), "Longitude": subset["Longitude"].mean()}).values()
+        elif agence in coords_agences:
+            lat_ag, lon_ag = coords_agences[agence]["Latitude"], coords_agences[agence]["Longitude"]
+        else:
+            lat_ag, lon_ag = subset["Latitude"].mean(), subset["Longitude"].mean()
+
+        folium.Marker(
+            location=[lat_ag, lon_ag],
+            popup=f"📍 {agence}",
+            tooltip=agence,
+            icon=folium.Icon(color=colors_agences.get(agence, "gray"), icon="building")
+        ).add_to(m)
+
+        # 🔶 Polygones de couverture de l'agence
+        if df_enveloppes is not None:
+            env = df_enveloppes[df_enveloppes["Code agence"] == agence]
+            if len(env) > 0:
+                couche_enveloppes(env, name=f"{agence} (zones)", couleur_contour=colors_agences.get(agence)).add_to(m)
+
+        # 🔷 Localités colorées par zone : une couche GeoJSON par agence
+        if points:
+            popups = subset["Commune"].astype(str) + " (" + subset["Zone"].astype(str) + ")"
+            groups[agence] = couche_localites(
+                geojson_localites(subset.assign(Popup=popups), popup_col="Popup"),
+                name=agence, radius=4
+            )
+            groups[agence].add_to(m)
+
+    if groups:
+        Search(
+            layer=list(groups.values())[0],
+            search_label="Commune",
+            placeholder="🔍 Chercher une localité...",
+            collapsed=False
+        ).add_to(m)
+
+    folium.LayerControl().add_to(m)
+    return m
@@ -1,6 +1,20 @@
+import atexit
+import io
+import json
+import os
+import queue
+import tempfile
+import threading
+import time
+from pathlib import Path
 import streamlit as st
 from sqlalchemy import create_engine, text
+from sqlalchemy.exc import SQLAlchemyError
 import pandas as pd
+from analytics.tranches import cube_palette, cube_poids, BINS_POIDS, LABELS_POIDS, BINS_UM, LABELS_UM
+from analytics.geo import enveloppes_agences
+from performance import chronometre, get_registre_sql, instrumenter_moteur
+from ingestion import compacter, NUMERIQUES_TABLES_EXPEDITIONS, CATEGORIES_TABLES_EXPEDITIONS
 from datetime import datetime, timezone, timedelta
 from zoneinfo import ZoneInfo 
 import pytz
@@ -9,31 +23,383 @@ import pytz
 
 db = st.secrets["database"]
 
+# === Paramètres du pool de connexions (surchargeables dans secrets.toml)
+POOL_SIZE = int(db.get("pool_size", 5))
+MAX_OVERFLOW = int(db.get("max_overflow", 10))
+POOL_RECYCLE = int(db.get("pool_recycle", 1800))  # secondes
+CACHE_TTL = int(db.get("cache_ttl", 600))  # secondes
+VERSION_TTL = int(db.get("version_ttl", 30))  # secondes entre deux sondes de version
+SEUIL_REQUETE_LENTE = float(db.get("slow_query_ms", 500)) / 1000  # secondes, requêtes signalées dans les logs
+
+# === Journal d'audit asynchrone
+AUDIT_BATCH_SIZE = int(db.get("audit_batch_size", 50))
+AUDIT_FLUSH_INTERVAL = float(db.get("audit_flush_interval", 2.0))  # secondes
+AUDIT_SYNC = bool(db.get("audit_sync", False))  # True : écriture synchrone (tests)
+AUDIT_MAX_RETRIES = int(db.get("audit_max_retries", 3))  # nouvelles tentatives d'un lot en échec
+AUDIT_RETRY_DELAY = float(db.get("audit_retry_delay", 1.0))  # secondes, doublé à chaque tentative
+AUDIT_FALLBACK_FILE = Path(db.get("audit_fallback_file", ".cache/audit_en_echec.jsonl"))
+
+# === Snapshots Parquet locaux des tables (rafraîchis seulement si la table a changé)
+SNAPSHOT_DIR = Path(db.get("snapshot_dir", ".cache/snapshots"))
+
+# Types compacts appliqués une fois au chargement (et conservés par les snapshots Parquet) :
+# catégories pour les libellés, float32 pour les coordonnées, décimales françaises converties
+TYPES_TABLES = {
+    "tranche_zone": (NUMERIQUES_TABLES_EXPEDITIONS, CATEGORIES_TABLES_EXPEDITIONS),
+    "pal_tranche": (NUMERIQUES_TABLES_EXPEDITIONS, CATEGORIES_TABLES_EXPEDITIONS),
+}
+
+# Colonne de date des tables d'expéditions, pour les filtres début / fin des chargeurs
+COLONNE_DATE = db.get("date_column", "Date")
+
+# Colonne sondée avec count(*) pour détecter un changement (id croissant ou updated_at)
+SNAPSHOT_TABLES = {
+    "cordonnee_agence": "id",
+    "zones_localites1": "id",
+    "zones_nv_agence": "id",
+    "tranche_zone": "id",
+    "pal_tranche": "id",
+}
+
+@st.cache_data(ttl=CACHE_TTL, show_spinner=False)
+@chronometre()
 def get_coordonnees_agences():
-    engine = get_engine()
-    query = "SELECT * FROM cordonnee_agence"
-    return pd.read_sql(query, engine)
+    return load_table("cordonnee_agence")
 
 
 
+@st.cache_resource
 def get_engine():
+    # Un seul moteur (et un seul pool) partagé par tout le processus Streamlit
     url = f"postgresql://{db.user}:{db.password}@{db.host}:{db.port}/{db.dbname}"
-    return create_engine(url)
+    engine = create_engine(
+        url,
+        pool_size=POOL_SIZE,
+        max_overflow=MAX_OVERFLOW,
+        pool_pre_ping=True,
+        pool_recycle=POOL_RECYCLE,
+    )
+    # Durée, lignes et page appelante de chaque requête (page ⏱️ Performances)
+    return instrumenter_moteur(engine, SEUIL_REQUETE_LENTE)
+
+
+def lire_sql(query, params=None):
+    # pd.read_sql + volume reçu (taille mémoire du DataFrame), rattaché à la requête journalisée
+    df = pd.read_sql(query, get_engine(), params=params)
+    get_registre_sql().noter_octets(df.memory_usage(deep=True).sum())
+    return df
+
+
+def get_table_version(table):
+    # Sonde peu coûteuse : nombre de lignes + max de la colonne de version + compteurs UPDATE / DELETE
+    # des statistiques PostgreSQL (un UPDATE ne change ni count(*) ni max(id) ; compteurs publiés
+    # par le serveur quelques secondes après la transaction, les écritures de l'appli invalident directement)
+    col = SNAPSHOT_TABLES.get(table)
+    modifs = "(SELECT n_tup_upd || ':' || n_tup_del FROM pg_stat_user_tables WHERE relname = :table)"
+    with get_engine().connect() as conn:
+        if col:
+            try:
+                n, v, m = conn.execute(
+                    text(f"SELECT count(*), max({col}), {modifs} FROM {table}"), {"table": table}
+                ).one()
+                return f"{n}|{v}|{m}"
+            except SQLAlchemyError:
+                conn.rollback()  # colonne absente : on se contente du nombre de lignes
+        n, m = conn.execute(text(f"SELECT count(*), {modifs} FROM {table}"), {"table": table}).one()
+    return f"{n}||{m}"
+
+
+@st.cache_data(ttl=VERSION_TTL, show_spinner=False)
+@chronometre()
+def get_data_version(*tables):
+    # Version combinée de plusieurs tables, pour servir de clé de cache aux artefacts dérivés
+    return "/".join(get_table_version(t) for t in tables)
+
+
+def _snapshot_paths(name):
+    return SNAPSHOT_DIR / f"{name}.parquet", SNAPSHOT_DIR / f"{name}.version"
+
+
+def invalidate_snapshot(table):
+    # Supprime le snapshot de la table et tous ses agrégats dérivés
+    for path in SNAPSHOT_DIR.glob(f"{table}.*"):
+        path.unlink(missing_ok=True)
+
+
+def _read_snapshot(name, version, colonnes=None, filtres=None):
+    # Projection et filtres appliqués par le lecteur Parquet (seuls les groupes de lignes utiles sont décodés)
+    parquet_path, version_path = _snapshot_paths(name)
+    try:
+        if not (parquet_path.exists() and version_path.exists() and version_path.read_text() == version):
+            return None
+        if colonnes is not None:
+            # Colonnes absentes du snapshot ignorées, comme pour les lectures en base
+            from pyarrow.parquet import read_schema
+            presentes = set(read_schema(parquet_path).names)
+            colonnes = [c for c in colonnes if c in presentes]
+        return pd.read_parquet(parquet_path, columns=colonnes, filters=filtres or None)
+    except (OSError, ValueError, ImportError) as e:
+        # Fichier tronqué, corrompu ou remplacé pendant la lecture : relu depuis la base
+        print(f"⚠️ Snapshot {name} illisible, relecture en base : {e}")
+        return None
+
+
+def _write_snapshot(name, df, version):
+    parquet_path, version_path = _snapshot_paths(name)
+    # Écriture atomique : fichiers temporaires propres à chaque écriture (les sessions Streamlit sont des
+    # threads d'un même processus), puis remplacement. Préfixe "." : hors du glob de invalidate_snapshot
+    tmp_paths, parquet_remplace = [], False
+    try:
+        SNAPSHOT_DIR.mkdir(parents=True, exist_ok=True)
+        for _ in range(2):
+            fd, tmp = tempfile.mkstemp(dir=SNAPSHOT_DIR, prefix=f".{name}.", suffix=".tmp")
+            os.close(fd)
+            tmp_paths.append(Path(tmp))
+        df.to_parquet(tmp_paths[0], index=False)
+        tmp_paths[1].write_text(version)
+        os.replace(tmp_paths[0], parquet_path)
+        parquet_remplace = True
+        os.replace(tmp_paths[1], version_path)
+    except (OSError, ValueError, TypeError, ImportError) as e:
+        # Snapshot impossible (disque, types mixtes...) : on sert quand même les données ;
+        # seuls nos fichiers temporaires sont supprimés, pas le snapshot d'une autre session
+        print(f"⚠️ Snapshot {name} non écrit : {e}")
+        for path in tmp_paths:
+            path.unlink(missing_ok=True)
+        if parquet_remplace:
+            version_path.unlink(missing_ok=True)  # parquet remplacé sans sa version : plus d'appariement
+
+
+# === Lectures partielles : colonnes + filtres (colonne, opérateur, valeur) au format des filtres Parquet
+
+
+@st.cache_data(ttl=CACHE_TTL, show_spinner=False)
+def get_colonnes(table):
+    with get_engine().connect() as conn:
+        return list(conn.execute(text(f"SELECT * FROM {table} LIMIT 0")).keys())
+
+
+def _filtres(colonnes_table, zone=None, agence=None, debut=None, fin=None):
+    # None : pas de filtre ; l'agence est ignorée si la table n'a pas de code agence,
+    # une période sur une table sans colonne de date est refusée (pas de filtre ignoré en silence)
+    filtres = []
+    if zone is not None:
+        filtres.append(("Zone", "==", zone))
+    if agence is not None and "Code agence" in colonnes_table:
+        filtres.append(("Code agence", "==", agence))
+    if (debut is not None or fin is not None) and COLONNE_DATE not in colonnes_table:
+        raise ValueError(f"Filtre de date impossible : colonne {COLONNE_DATE!r} absente")
+    if debut is not None:
+        filtres.append((COLONNE_DATE, ">=", pd.Timestamp(debut)))
+    if fin is not None:
+        filtres.append((COLONNE_DATE, "<", pd.Timestamp(fin)))
+    return filtres
+
+
+def _identifiant(colonne):
+    return '"' + str(colonne).replace('"', '""') + '"'
+
+
+def _where(filtres):
+    # WHERE "col" = :f0 AND ... (valeurs toujours passées en paramètres) ;
+    # libellés comparés sans espaces superflus, comme après le typage pandas
+    conditions, params = [], {}
+    for i, (colonne, op, valeur) in enumerate(filtres):
+        expr = _libelle_sql(colonne) if op == "==" and isinstance(valeur, str) else _identifiant(colonne)
+        conditions.append(f"{expr} {'=' if op == '==' else op} :f{i}")
+        params[f"f{i}"] = valeur
+    return (f"WHERE {' AND '.join(conditions)}" if conditions else ""), params
 
+
+def _requete_partielle(table, colonnes, filtres):
+    select = ", ".join(_identifiant(c) for c in colonnes) if colonnes else "*"
+    where, params = _where(filtres)
+    return text(f"SELECT {select} FROM {table} {where}"), params
+
+
+def _projeter(df, colonnes):
+    return df[[c for c in colonnes if c in df.columns]] if colonnes else df
+
+
+def _typer(table, df):
+    if table in TYPES_TABLES:
+        numeriques, categories = TYPES_TABLES[table]
+        df = compacter(df, numeriques, categories)
+    return df
+
+
+def load_table(table, version=None, colonnes=None, zone=None, agence=None, debut=None, fin=None):
+    if table not in SNAPSHOT_TABLES:
+        raise ValueError(f"Table inconnue : {table}")
+
+    version = version or get_table_version(table)
+    if colonnes is None and zone is None and agence is None and debut is None and fin is None:
+        df = _read_snapshot(table, version)
+        if df is not None:
+            # Snapshot écrit avant le typage : converti à la lecture (sans effet s'il est déjà typé)
+            return _typer(table, df)
+        df = _typer(table, lire_sql(f"SELECT * FROM {table}"))
+        _write_snapshot(table, df, version)
+        return df
+
+    # Lecture partielle : depuis le snapshot s'il est à jour, sinon seules les lignes et colonnes
+    # demandées sont transférées par la base (le snapshot complet n'est pas écrit dans ce cas)
+    disponibles = get_colonnes(table)
+    colonnes = [c for c in colonnes if c in disponibles] if colonnes else None
+    filtres = _filtres(disponibles, zone, agence, debut, fin)
+    df = _read_snapshot(table, version, colonnes, filtres)
+    if df is None:
+        query, params = _requete_partielle(table, colonnes, filtres)
+        df = lire_sql(query, params=params)
+    return _typer(table, df)
+
+
+def load_derived(table, name, builder, colonnes=None, zone=None, agence=None, agregat=None):
+    # Agrégat calculé une fois par version de la table puis relu depuis le disque (colonnes / filtres appliqués à la relecture).
+    # agregat : même calcul fait par la base (sans transférer la table), `builder` en pandas en secours.
+    # Snapshot absent et zone / agence demandée : seules les lignes filtrées sont agrégées (snapshot non écrit)
+    version = get_table_version(table)
+    key = f"{table}.{name}"
+    filtre = zone is not None or agence is not None
+    filtres = _filtres(get_colonnes(table), zone, agence) if filtre else []
+    df = _read_snapshot(key, version, colonnes, filtres)
+    if df is None:
+        if agregat is not None:
+            try:
+                df = agregat(zone=zone, agence=agence)
+            except SQLAlchemyError as e:
+                print(f"⚠️ Agrégat {key} non calculé en base, calcul en pandas : {e}")
+        if df is None:
+            df = builder(load_table(table, version=version, zone=zone, agence=agence))
+        if not filtre:
+            _write_snapshot(key, df, version)
+        df = _projeter(df, colonnes)
+    return df
+
+
+# === Agrégats calculés par la base : GROUP BY + width_bucket sur les bornes des tranches.
+# Mêmes cubes que cube_poids / cube_palette (analytics.tranches), quelques centaines de lignes transférées
+def _nombre_sql(colonne):
+    # "12,5" -> 12.5, que la colonne soit numérique ou texte (comme nombre_fr)
+    return f"CAST(replace(CAST({_identifiant(colonne)} AS text), ',', '.') AS double precision)"
+
+
+def _libelle_sql(colonne):
+    # Libellé nettoyé (comme libelles)
+    return f"trim(CAST({_identifiant(colonne)} AS text))"
+
+
+def _tranche_sql(valeur, bornes, droite):
+    # Numéro de tranche 1..n comme pd.cut ; 0 ou n + 1 hors tranches.
+    # width_bucket est fermé à gauche : pour des intervalles fermés à droite on classe -valeur sur les bornes opposées
+    if droite:
+        return f"{len(bornes)} - width_bucket(-({valeur}), CAST(:bornes AS double precision[]))", [-b for b in reversed(bornes)]
+    return f"width_bucket({valeur}, CAST(:bornes AS double precision[]))", list(bornes)
+
+
+def _agreger(table, dimensions, valeurs, cle, bornes, droite, mesures, filtres):
+    # dimensions / valeurs : {colonne: expression SQL sur la table} ; tranche calculée sur valeurs[cle]
+    # mesures : {colonne du cube: agrégat SQL sur les dimensions et valeurs}
+    where, params = _where(filtres)
+    tranche, params["bornes"] = _tranche_sql(_identifiant(cle), bornes, droite)
+    select = ", ".join(f"{expr} AS {_identifiant(nom)}" for nom, expr in {**dimensions, **valeurs}.items())
+    groupes = ", ".join(_identifiant(nom) for nom in dimensions)
+    agregats = ", ".join(f"{expr} AS {_identifiant(nom)}" for nom, expr in mesures.items())
+    query = text(f"""
+        SELECT {groupes}, tranche, {agregats}
+        FROM (SELECT *, {tranche} AS tranche FROM (SELECT {select} FROM {table} {where}) v) t
+        WHERE tranche BETWEEN 1 AND {len(bornes) - 1}
+        GROUP BY {groupes}, tranche
+    """)
+    return lire_sql(query, params=params)
+
+
+def _finaliser(cube, table, dimensions, nom_tranche, libelles_tranches):
+    # Numéro de tranche -> libellé catégoriel ordonné, lignes dans l'ordre du groupby pandas ;
+    # dimensions typées comme la table chargée (_typer) pour que le cube ait les types du calcul pandas
+    tranches = pd.Categorical.from_codes(cube.pop("tranche").to_numpy() - 1, categories=libelles_tranches, ordered=True)
+    cube.insert(len(dimensions), nom_tranche, tranches)
+    cube = _typer(table, cube)
+    return cube.sort_values([*dimensions, nom_tranche]).reset_index(drop=True)
+
+
+def agreger_poids(table="tranche_zone", zone=None, agence=None, debut=None, fin=None):
+    # Équivalent SQL de cube_poids : agence x zone x commune x tranche de poids
+    colonnes = get_colonnes(table)
+    dimensions = {"Code agence": _libelle_sql("Code agence")} if "Code agence" in colonnes else {}
+    dimensions.update({"Zone": _libelle_sql("Zone"), "Commune": _libelle_sql("Commune")})
+    valeurs = {"Poids": _nombre_sql("Poids")}
+    mesures = {"Nb_exp": "count(*)", "Poids_total": 'sum("Poids")'}
+    if "UM" in colonnes:
+        valeurs["UM"] = _nombre_sql("UM")
+        mesures.update({"UM_total": 'COALESCE(sum("UM"), 0)', "UM_nb": 'count("UM")'})
+    cube = _agreger(
+        table, dimensions, valeurs, "Poids", BINS_POIDS, False, mesures,
+        _filtres(colonnes, zone, agence, debut, fin),
+    )
+    return _finaliser(cube, table, list(dimensions), "Tranche", LABELS_POIDS)
+
+
+def agreger_palette(table="pal_tranche", zone=None, agence=None, debut=None, fin=None):
+    # Équivalent SQL de cube_palette : agence x zone x commune x tranche UM
+    colonnes = get_colonnes(table)
+    dimensions = {"Code agence": _libelle_sql("Code agence")} if "Code agence" in colonnes else {}
+    dimensions["Zone"] = _libelle_sql("Zone")
+    if "Commune" in colonnes:
+        dimensions["Commune"] = _libelle_sql("Commune")
+    cube = _agreger(
+        table, dimensions, {"UM": _nombre_sql("UM")}, "UM", BINS_UM, True,
+        {"Nb_exp": "count(*)", "UM_total": 'sum("UM")'},
+        _filtres(colonnes, zone, agence, debut, fin),
+    )
+    return _finaliser(cube, table, list(dimensions), "Tranche_UM", LABELS_UM)
+
+
+@st.cache_data(ttl=CACHE_TTL, show_spinner=False)
+@chronometre()
 def get_zones():
-    engine = get_engine()
-    query = "SELECT * FROM zones_localites1"
-    return pd.read_sql(query, engine)
+    return load_table("zones_localites1")
 
-def get_tranches():
-    engine = get_engine()
-    query = "SELECT * FROM tranche_zone"
-    return pd.read_sql(query, engine)
+@st.cache_data(ttl=CACHE_TTL, show_spinner=False)
+@chronometre()
+def get_tranches(colonnes=None, zone=None, agence=None, debut=None, fin=None):
+    return load_table("tranche_zone", colonnes=colonnes, zone=zone, agence=agence, debut=debut, fin=fin)
 
-def get_palette():
-    engine = get_engine()
-    query = "SELECT * FROM pal_tranche"
-    return pd.read_sql(query, engine)
+@st.cache_data(ttl=CACHE_TTL, show_spinner=False)
+@chronometre()
+def get_palette(colonnes=None, zone=None, agence=None, debut=None, fin=None):
+    return load_table("pal_tranche", colonnes=colonnes, zone=zone, agence=agence, debut=debut, fin=fin)
+
+@st.cache_data(ttl=CACHE_TTL, show_spinner=False)
+@chronometre()
+def get_cube_poids(colonnes=None, zone=None, agence=None):
+    return load_derived(
+        "tranche_zone", "cube_poids", cube_poids, colonnes=colonnes, zone=zone, agence=agence, agregat=agreger_poids
+    )
+
+# Noms de colonnes des tables de localités -> noms affichés dans les pages
+RENOMMAGE_LOCALITES = {
+    "commune": "Commune", "code_agence": "Code agence", "zone": "Zone",
+    "latitude": "Latitude", "longitude": "Longitude",
+}
+
+@st.cache_data(ttl=CACHE_TTL, show_spinner=False)
+@chronometre()
+def get_enveloppes(table="zones_localites1"):
+    # Polygones de couverture par agence et par zone, recalculés seulement quand la table change
+    def construire(df):
+        df = df.rename(columns=RENOMMAGE_LOCALITES)
+        if "Code agence" not in df.columns:
+            df = df.assign(**{"Code agence": "Nouvelle Agence"})
+        return enveloppes_agences(df)
+    return load_derived(table, "enveloppes", construire)
+
+@st.cache_data(ttl=CACHE_TTL, show_spinner=False)
+@chronometre()
+def get_cube_palette(colonnes=None, zone=None, agence=None):
+    return load_derived(
+        "pal_tranche", "cube_palette", cube_palette, colonnes=colonnes, zone=zone, agence=agence, agregat=agreger_palette
+    )
 
 
 
@@ -50,11 +416,6 @@ def insert_localite(commune, zone, code_agence, lat, lon, lat_ag, lon_ag, distan
         "distance": float(distance)
     }
 
-    # DEBUG : affiche les valeurs et types
-    print("🔍 [DEBUG] Données envoyées à PostgreSQL :")
-    for key, value in params.items():
-        print(f"  {key}: {value!r} ({type(value).__name__})")
-
     query = text("""
         INSERT INTO zones_localites1
         (commune, zone, code_agence, latitude, longitude, latitude_agence, longitude_agence, "distance (km)")
@@ -62,6 +423,7 @@ def insert_localite(commune, zone, code_agence, lat, lon, lat_ag, lon_ag, distan
     """)
     with engine.begin() as conn:
         conn.execute(query, params)
+    invalidate_snapshot("zones_localites1")
 
         
 
@@ -81,11 +443,6 @@ def update_localite(id, commune, zone, code_agence, lat, lon, lat_ag, lon_ag, di
         "distance": distance
     }
 
-    # DEBUG : affiche les valeurs et types
-    print("🔍 [DEBUG] Données envoyées à PostgreSQL (UPDATE) :")
-    for key, value in params.items():
-        print(f"  {key}: {value!r} ({type(value).__name__})")
-
     query = text("""
         UPDATE zones_localites1
         SET commune = :commune,
@@ -100,6 +457,8 @@ def update_localite(id, commune, zone, code_agence, lat, lon, lat_ag, lon_ag, di
     """)
     with engine.begin() as conn:
         conn.execute(query, params)
+    # Un UPDATE ne change ni count(*) ni max(id) : on invalide explicitement
+    invalidate_snapshot("zones_localites1")
 
 
 def delete_localite(id):
@@ -107,30 +466,348 @@ def delete_localite(id):
     query = text("DELETE FROM zones_localites1 WHERE id = :id")
     with engine.begin() as conn:
         conn.execute(query, {"id": id})
+    invalidate_snapshot("zones_localites1")
+
+
+# === Import en masse de localités (COPY + upsert ensembliste)
+# Colonnes du CSV (format normatrans_zones_final_localites.csv) -> colonnes de zones_localites1
+LOCALITE_CSV_COLUMNS = {
+    "Commune": "commune",
+    "Zone": "zone",
+    "Code agence": "code_agence",
+    "Latitude": "latitude",
+    "Longitude": "longitude",
+    "Latitude_agence": "latitude_agence",
+    "Longitude_agence": "longitude_agence",
+    "Distance (km)": "distance (km)",
+}
+LOCALITE_NUMERIC_COLUMNS = ["latitude", "longitude", "latitude_agence", "longitude_agence", "distance (km)"]
+
+
+def prepare_localites(df):
+    df = df.rename(columns=lambda c: str(c).strip())
+    manquantes = [c for c in LOCALITE_CSV_COLUMNS if c not in df.columns]
+    if manquantes:
+        raise ValueError(f"Colonnes manquantes dans le CSV : {', '.join(manquantes)}")
+
+    out = df[list(LOCALITE_CSV_COLUMNS)].rename(columns=LOCALITE_CSV_COLUMNS)
+    # Lignes sans commune ou agence écartées avant la conversion en texte (NaN -> "nan" sinon)
+    out = out.dropna(subset=["commune", "code_agence"])
+    for col in ["commune", "zone", "code_agence"]:
+        out[col] = out[col].where(out[col].isna(), out[col].astype(str).str.strip())
+    for col in LOCALITE_NUMERIC_COLUMNS:
+        out[col] = pd.to_numeric(out[col].astype(str).str.replace(",", "."), errors="coerce")
+
+    out = out[(out["commune"] != "") & (out["code_agence"] != "")]
+    # Une seule ligne par (commune, agence) : la dernière du fichier l'emporte
+    return out.drop_duplicates(subset=["commune", "code_agence"], keep="last")
+
+
+def bulk_upsert_localites(df, delete_missing=False, dry_run=False):
+    staging = prepare_localites(df)
+    cols = ", ".join(f'"{c}"' for c in LOCALITE_CSV_COLUMNS.values())
+    data_cols = [c for c in LOCALITE_CSV_COLUMNS.values() if c not in ("commune", "code_agence")]
+    set_clause = ", ".join(f'"{c}" = s."{c}"' for c in data_cols)
+    distinct_clause = (
+        "(" + ", ".join(f'z."{c}"' for c in data_cols) + ") IS DISTINCT FROM ("
+        + ", ".join(f's."{c}"' for c in data_cols) + ")"
+    )
+
+    buffer = io.StringIO()
+    staging.to_csv(buffer, index=False, header=False)
+    buffer.seek(0)
+
+    with get_engine().connect() as conn:
+        trans = conn.begin()
+        try:
+            conn.execute(text(f"""
+                CREATE TEMP TABLE staging_localites (
+                    commune text, zone text, code_agence text,
+                    {", ".join(f'"{c}" double precision' for c in LOCALITE_NUMERIC_COLUMNS)}
+                ) ON COMMIT DROP
+            """))
+            with conn.connection.cursor() as cur:
+                cur.copy_expert(f"COPY staging_localites ({cols}) FROM STDIN WITH (FORMAT csv)", buffer)
+
+            modifiees = conn.execute(text(f"""
+                UPDATE zones_localites1 AS z
+                SET {set_clause}
+                FROM staging_localites AS s
+                WHERE z.commune = s.commune AND z.code_agence = s.code_agence
+                  AND {distinct_clause}
+            """)).rowcount
+
+            supprimees = 0
+            if delete_missing:
+                # Limité aux agences présentes dans le fichier
+                supprimees = conn.execute(text("""
+                    DELETE FROM zones_localites1 AS z
+                    WHERE z.code_agence IN (SELECT DISTINCT code_agence FROM staging_localites)
+                      AND NOT EXISTS (
+                          SELECT 1 FROM staging_localites AS s
+                          WHERE s.commune = z.commune AND s.code_agence = z.code_agence
+                      )
+                """)).rowcount
+
+            inserees = conn.execute(text(f"""
+                INSERT INTO zones_localites1 ({cols})
+                SELECT {", ".join(f's."{c}"' for c in LOCALITE_CSV_COLUMNS.values())}
+                FROM staging_localites AS s
+                WHERE NOT EXISTS (
+                    SELECT 1 FROM zones_localites1 AS z
+                    WHERE z.commune = s.commune AND z.code_agence = s.code_agence
+                )
+            """)).rowcount
+
+            if dry_run:
+                trans.rollback()
+            else:
+                trans.commit()
+        except Exception:
+            trans.rollback()
+            raise
+
+    if not dry_run:
+        invalidate_snapshot("zones_localites1")
+
+    return {
+        "lignes_fichier": len(staging),
+        "inserees": inserees,
+        "modifiees": modifiees,
+        "inchangees": len(staging) - inserees - modifiees,
+        "supprimees": supprimees,
+    }
 
 
 def get_local_time():
     # return datetime.now(ZoneInfo("Europe/Paris"))
     return datetime.utcnow() + timedelta(hours=2)
 
-def log_action(username, action, details):
-    engine = get_engine()
-    query = text("""
-        INSERT INTO logs (username, action, details, timestamp)
-        VALUES (:username, :action, :details, :timestamp)
-    """)
-    with engine.begin() as conn:
-        conn.execute(query, {
-            "username": username,
-            "action": action,
-            "details": details,
-            "timestamp": get_local_time()  
-        })
-        
+def _insert_logs(rows):
+    # Un seul INSERT multi-lignes pour tout le lot
+    values = []
+    params = {}
+    for i, row in enumerate(rows):
+        values.append(f"(:username_{i}, :action_{i}, :details_{i}, :timestamp_{i})")
+        for key, value in row.items():
+            params[f"{key}_{i}"] = value
+    query = text(
+        "INSERT INTO logs (username, action, details, timestamp) VALUES " + ", ".join(values)
+    )
+    with get_engine().begin() as conn:
+        conn.execute(query, params)
+
+
+class AuditWriter:
+    # Écrit les logs en arrière-plan : file d'attente + thread qui regroupe les INSERT
+
+    _STOP = object()
+
+    def __init__(self, batch_size=AUDIT_BATCH_SIZE, flush_interval=AUDIT_FLUSH_INTERVAL,
+                 max_retries=AUDIT_MAX_RETRIES, retry_delay=AUDIT_RETRY_DELAY):
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_retries = max_retries
+        self.retry_delay = retry_delay
+        self._echecs = 0
+        self._erreur = None
+        self._lock = threading.Lock()
+        self._queue = queue.Queue()
+        self._thread = threading.Thread(target=self._run, name="audit-writer", daemon=True)
+        self._thread.start()
+
+    def submit(self, row):
+        # Ne bloque jamais l'appelant (file non bornée)
+        self._queue.put(row)
+
+    def flush(self, timeout=None):
+        # Demande une écriture immédiate et attend qu'elle soit faite
+        if not self._thread.is_alive():
+            return False
+        done = threading.Event()
+        self._queue.put(done)
+        return done.wait(timeout)
+
+    def close(self, timeout=5):
+        if self._thread.is_alive():
+            self._queue.put(self._STOP)
+            self._thread.join(timeout)
+
+    def pop_erreur(self):
+        # Dernier échec définitif (lignes reportées dans le fichier de secours), une seule fois
+        with self._lock:
+            erreur, self._erreur = self._erreur, None
+        return erreur
+
+    def _write(self, buffer, dernier_essai=False):
+        # True si le tampon est écrit (ou vide) ; en cas d'échec il est conservé pour une nouvelle tentative,
+        # puis reporté dans AUDIT_FALLBACK_FILE après max_retries tentatives
+        if not buffer:
+            return True
+        try:
+            _insert_logs(buffer)
+        except Exception as e:  # le thread d'écriture ne doit jamais s'arrêter
+            self._echecs += 1
+            print(f"⚠️ Échec d'écriture de {len(buffer)} log(s) (tentative {self._echecs}) : {e}")
+            if self._echecs <= self.max_retries and not dernier_essai:
+                return False
+            self._sauver(buffer, e)
+        buffer.clear()
+        self._echecs = 0
+        return True
+
+    def _sauver(self, buffer, erreur):
+        try:
+            AUDIT_FALLBACK_FILE.parent.mkdir(parents=True, exist_ok=True)
+            with AUDIT_FALLBACK_FILE.open("a", encoding="utf-8") as f:
+                for row in buffer:
+                    f.write(json.dumps(row, default=str, ensure_ascii=False) + "\n")
+            message = f"{len(buffer)} log(s) non écrits en base, reportés dans {AUDIT_FALLBACK_FILE} : {erreur}"
+        except OSError as e:
+            message = f"{len(buffer)} log(s) perdus (base : {erreur} ; fichier de secours : {e})"
+        print(f"⚠️ {message}")
+        with self._lock:
+            self._erreur = message
+
+    def _retry_deadline(self):
+        return time.monotonic() + self.retry_delay * 2 ** (self._echecs - 1)
+
+    def _run(self):
+        buffer = []
+        deadline = None
+        while True:
+            timeout = None if deadline is None else max(0.0, deadline - time.monotonic())
+            try:
+                item = self._queue.get(timeout=timeout)
+            except queue.Empty:
+                item = None
+
+            if item is self._STOP:
+                self._write(buffer, dernier_essai=True)
+                return
+            if isinstance(item, threading.Event):
+                deadline = None if self._write(buffer) else self._retry_deadline()
+                item.set()
+                continue
+            if item is not None:
+                buffer.append(item)
+                if deadline is None:
+                    deadline = time.monotonic() + self.flush_interval
+
+            # Après un échec, on attend l'échéance de la nouvelle tentative même si le lot est plein
+            pret = len(buffer) >= self.batch_size and self._echecs == 0
+            if pret or (deadline is not None and time.monotonic() >= deadline):
+                deadline = None if self._write(buffer) else self._retry_deadline()
+
+
+@st.cache_resource
+def get_audit_writer():
+    writer = AuditWriter()
+    atexit.register(writer.close)  # vide le tampon à l'arrêt du serveur
+    return writer
+
+
+def log_action(username, action, details, sync=AUDIT_SYNC):
+    row = {
+        "username": username,
+        "action": action,
+        "details": details,
+        "timestamp": get_local_time(),
+    }
+    if sync:
+        # Écriture synchrone (tests, scripts) : la ligne est en base au retour
+        _insert_logs([row])
+    else:
+        writer = get_audit_writer()
+        writer.submit(row)
+        erreur = writer.pop_erreur()
+        if erreur:
+            st.warning(f"⚠️ Journal d'audit : {erreur}")
+
+
+@st.cache_data(ttl=CACHE_TTL, show_spinner=False)
+@chronometre()
 def get_zones_nv_agence():
+    return load_table("zones_nv_agence")
+
+
+
+
+
+# === Consultation paginée des logs (pagination par clé sur timestamp, id)
+LOGS_INDEXES = {
+    "idx_logs_timestamp_id": "CREATE INDEX IF NOT EXISTS idx_logs_timestamp_id ON logs (timestamp DESC, id DESC)",
+    "idx_logs_username_timestamp": "CREATE INDEX IF NOT EXISTS idx_logs_username_timestamp ON logs (username, timestamp DESC, id DESC)",
+    "idx_logs_action_timestamp": "CREATE INDEX IF NOT EXISTS idx_logs_action_timestamp ON logs (action, timestamp DESC, id DESC)",
+    "idx_logs_details_trgm": "CREATE INDEX IF NOT EXISTS idx_logs_details_trgm ON logs USING gin (details gin_trgm_ops)",
+}
+
+
+@st.cache_resource
+def ensure_logs_indexes():
+    # Crée les index manquants une fois par processus ; renvoie ceux réellement présents
     engine = get_engine()
-    query = "SELECT * FROM zones_nv_agence"
-    return pd.read_sql(query, engine)
+    for name, ddl in LOGS_INDEXES.items():
+        try:
+            with engine.begin() as conn:
+                if name == "idx_logs_details_trgm":
+                    conn.execute(text("CREATE EXTENSION IF NOT EXISTS pg_trgm"))
+                conn.execute(text(ddl))
+        except SQLAlchemyError as e:
+            print(f"⚠️ Index {name} non créé : {e}")
+
+    with engine.connect() as conn:
+        presents = conn.execute(
+            text("SELECT indexname FROM pg_indexes WHERE tablename = 'logs'")
+        ).scalars().all()
+    return [name for name in LOGS_INDEXES if name in presents]
+
 
+@st.cache_data(ttl=CACHE_TTL, show_spinner=False)
+@chronometre()
+def get_logs_filter_values():
+    # Valeurs distinctes pour les listes déroulantes (parcours d'index)
+    with get_engine().connect() as conn:
+        users = conn.execute(text("SELECT DISTINCT username FROM logs ORDER BY username")).scalars().all()
+        actions = conn.execute(text("SELECT DISTINCT action FROM logs ORDER BY action")).scalars().all()
+    return users, actions
 
 
+@chronometre()
+def get_logs_page(limit=50, after=None, username=None, action=None, start=None, end=None, search=None):
+    # `after` = (timestamp, id) de la dernière ligne de la page précédente
+    conditions = []
+    params = {"limit": limit + 1}
+    if after is not None:
+        conditions.append("(timestamp, id) < (:after_ts, :after_id)")
+        params["after_ts"], params["after_id"] = after
+    if username:
+        conditions.append("username = :username")
+        params["username"] = username
+    if action:
+        conditions.append("action = :action")
+        params["action"] = action
+    if start is not None:
+        conditions.append("timestamp >= :start")
+        params["start"] = start
+    if end is not None:
+        conditions.append("timestamp < :end")
+        params["end"] = end
+    if search:
+        escaped = search.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+        conditions.append("details ILIKE :search")
+        params["search"] = f"%{escaped}%"
+
+    where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+    query = text(f"""
+        SELECT id, timestamp, username, action, details
+        FROM logs
+        {where}
+        ORDER BY timestamp DESC, id DESC
+        LIMIT :limit
+    """)
+    df = lire_sql(query, params=params)
+
+    # Une ligne de plus que demandé indique qu'il existe une page suivante
+    has_more = len(df) > limit
+    return df.iloc[:limit], has_more
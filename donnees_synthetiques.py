@@ -0,0 +1,148 @@
+from datetime import datetime
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+from analytics.geo import nearest
+
+# Volumes des fichiers réels (échelle 1x)
+NB_AGENCES = 5
+NB_LOCALITES = 1967
+NB_EXPEDITIONS = 11282
+NB_LOGS = 5000
+
+# Emprise géographique (Normandie) et paramètres des distributions observées
+EMPRISE = {"lat": (48.2, 50.0), "lon": (-1.9, 1.8)}
+DEPARTEMENTS = ["14", "27", "50", "61", "76"]
+SEUILS_ZONES = (25, 50)  # Zone 1 < 25 km <= Zone 2 < 50 km <= Zone 3
+FACTEUR_ROUTE = 1.25  # distance routière / distance à vol d'oiseau
+DISPERSION_KM = 22  # écart-type autour de l'agence (réel : ~45 % Zone 1, ~45 % Zone 2, ~10 % Zone 3)
+ACTIONS_LOGS = ["Connexion", "Déconnexion", "Ajout localité", "Modification localité",
+                "Suppression localité", "Import localités"]
+
+
+def generer_agences(echelle=1, graine=0):
+    # Le nombre d'agences croît moins vite que le volume (racine de l'échelle)
+    rng = np.random.default_rng(graine)
+    n = NB_AGENCES * int(np.ceil(np.sqrt(echelle)))
+    dpt = rng.choice(DEPARTEMENTS, n)
+    codes = [f"NT{d}{i:03d}" for i, d in enumerate(dpt)]
+    return pd.DataFrame({
+        "Code agence": codes,
+        "Commune": [f"AGENCE {i:03d}" for i in range(n)],
+        "Code postal": [f"{d}{rng.integers(0, 1000):03d}" for d in dpt],
+        "Latitude": rng.uniform(*EMPRISE["lat"], n),
+        "Longitude": rng.uniform(*EMPRISE["lon"], n),
+    })
+
+
+def generer_localites(echelle=1, graine=0, agences=None):
+    # Schéma de normatrans_zones_final_localites.csv : communes dispersées autour des agences,
+    # puis rattachées à l'agence la plus proche
+    rng = np.random.default_rng(graine + 1)
+    agences = generer_agences(echelle, graine) if agences is None else agences
+    n = NB_LOCALITES * echelle
+    centre = rng.integers(0, len(agences), n)
+    lat = agences["Latitude"].to_numpy()[centre] + rng.normal(0, DISPERSION_KM / 111, n)
+    lon = agences["Longitude"].to_numpy()[centre] + rng.normal(0, DISPERSION_KM / 73, n)
+    idx, dist = nearest(lat, lon, agences["Latitude"], agences["Longitude"])
+    distance = (dist * FACTEUR_ROUTE).round(2)
+    ag = agences.iloc[idx].reset_index(drop=True)
+    dpt = ag["Code agence"].str[2:4]
+    return pd.DataFrame({
+        "Pays": "FR",
+        "Dpt": dpt,
+        "Code INSEE": dpt + pd.Series(np.arange(n) % 1000).map("{:03d}".format),
+        "CP": dpt + pd.Series(rng.integers(0, 1000, n)).map("{:03d}".format),
+        "Commune": [f"COMMUNE {i:07d}" for i in range(n)],
+        "Code agence": ag["Code agence"],
+        "Code Directionnel": ag["Code agence"].str[2:],
+        "Latitude": lat,
+        "Longitude": lon,
+        "Commune_agence": ag["Commune"],
+        "Code postal": ag["Code postal"],
+        "Latitude_agence": ag["Latitude"],
+        "Longitude_agence": ag["Longitude"],
+        "Distance (km)": distance,
+        "Zone": np.select(
+            [distance < SEUILS_ZONES[0], distance < SEUILS_ZONES[1]], ["Zone 1", "Zone 2"], "Zone 3"
+        ),
+    })
+
+
+def generer_expeditions(localites, echelle=1, graine=0):
+    # Schéma de pal_tranche.csv : communes tirées selon une popularité log-normale,
+    # UM géométrique (médiane 1, max 30), poids proportionnel aux UM.
+    # Colonnes texte construites par localité puis indexées en catégories (tient à 1000x en mémoire)
+    rng = np.random.default_rng(graine + 2)
+    n = NB_EXPEDITIONS * echelle
+    agence = "NORMATRANS " + localites["Dpt"] + " " + localites["Commune_agence"]
+    par_localite = pd.DataFrame({
+        "Agence entree reseau": agence,
+        "Agence sortie reseau": agence,
+        "Département": localites["Dpt"],
+        "INSEE": localites["Code INSEE"],
+        "Cp": localites["CP"],
+        "Ville": localites["Commune"],
+        "PS": "[" + localites["Code agence"] + "] " + agence,
+        "Correspondant": localites["Code agence"],
+        "Zone": localites["Zone"],
+    }).astype("category")
+
+    popularite = rng.lognormal(0, 1.2, len(localites))
+    tirage = rng.choice(len(localites), n, p=popularite / popularite.sum())
+    um = np.minimum(rng.geometric(0.55, n), 30)
+    df = par_localite.iloc[tirage].reset_index(drop=True)
+    df.insert(8, "Ligne depart", rng.integers(1, 200, n))
+    df.insert(9, "UM", um)
+    df.insert(10, "Poids", (um * rng.lognormal(np.log(380), 0.6, n)).round(0))
+    df.insert(11, "Latitude", localites["Latitude"].to_numpy()[tirage])
+    df.insert(12, "Longitude", localites["Longitude"].to_numpy()[tirage])
+    return df
+
+
+def generer_logs(echelle=1, graine=0):
+    # Schéma de la table logs (id, username, action, details, timestamp), un mois d'activité
+    rng = np.random.default_rng(graine + 3)
+    n = NB_LOGS * echelle
+    debut = datetime(2025, 1, 1)
+    secondes = np.sort(rng.integers(0, 30 * 24 * 3600, n))
+    return pd.DataFrame({
+        "id": np.arange(1, n + 1),
+        "username": rng.choice([f"utilisateur{i}" for i in range(20)], n),
+        "action": rng.choice(ACTIONS_LOGS, n, p=[0.35, 0.3, 0.1, 0.15, 0.05, 0.05]),
+        "details": [f"COMMUNE {i:07d} | Zone {z} | NT14G" for i, z in zip(rng.integers(0, 10 ** 6, n), rng.integers(1, 4, n))],
+        "timestamp": pd.Timestamp(debut) + pd.to_timedelta(secondes, unit="s"),
+    })
+
+
+def format_base(expeditions):
+    # Noms de colonnes de la table pal_tranche en base (ceux attendus par les pages)
+    return expeditions.rename(columns={"Ville": "Commune", "Correspondant": "Code agence"})
+
+
+def jeu_de_donnees(echelle=1, graine=0):
+    agences = generer_agences(echelle, graine)
+    localites = generer_localites(echelle, graine, agences)
+    return {
+        "agences": agences,
+        "localites": localites,
+        "expeditions": generer_expeditions(localites, echelle, graine),
+        "logs": generer_logs(echelle, graine),
+    }
+
+
+def ecrire_csv(dossier, echelle=1, graine=0):
+    # Fichiers au format des exports réels (séparateur ;, latin1), utilisables comme uploads
+    dossier = Path(dossier)
+    dossier.mkdir(parents=True, exist_ok=True)
+    jeu = jeu_de_donnees(echelle, graine)
+    fichiers = {
+        "coordonnees_agences_normatrans.csv": jeu["agences"],
+        "normatrans_zones_final_localites.csv": jeu["localites"],
+        "pal_tranche.csv": jeu["expeditions"],
+        "logs.csv": jeu["logs"],
+    }
+    for nom, df in fichiers.items():
+        df.to_csv(dossier / nom, sep=";", index=False, encoding="latin1")
+    return [dossier / nom for nom in fichiers]
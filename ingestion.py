@@ -0,0 +1,139 @@
+import codecs
+
+import numpy as np
+import pandas as pd
+from pandas.api.types import union_categoricals
+
+MAX_MEMOIRE_MO = 512  # plafond mémoire du DataFrame chargé
+TAILLE_BLOC = 200_000  # lignes lues par bloc
+TAILLE_ECHANTILLON = 64 * 1024  # octets lus pour détecter l'encodage
+
+
+def detecter_encodage(fichier):
+    # UTF-8 si l'échantillon se décode (BOM géré), sinon latin1 (exports Windows)
+    position = fichier.tell()
+    echantillon = fichier.read(TAILLE_ECHANTILLON)
+    fichier.seek(position)
+    if echantillon.startswith(codecs.BOM_UTF8):
+        return "utf-8-sig"
+    try:
+        # final=False : un caractère multi-octets coupé en fin d'échantillon n'est pas une erreur
+        codecs.getincrementaldecoder("utf-8")().decode(echantillon, final=False)
+        return "utf-8"
+    except UnicodeDecodeError:
+        return "latin1"
+
+
+def nombres_fr(serie, dtype=np.float32):
+    # "12,5" -> 12.5 ; valeurs illisibles -> NaN
+    if pd.api.types.is_numeric_dtype(serie):
+        return serie.astype(dtype)
+    return pd.to_numeric(serie.str.strip().str.replace(",", ".", regex=False), errors="coerce").astype(dtype)
+
+
+def _compacter(bloc, numeriques, categories):
+    bloc.columns = bloc.columns.str.strip()
+    for col in bloc.columns:
+        if col in numeriques:
+            bloc[col] = nombres_fr(bloc[col], numeriques[col])
+        elif col in categories and not isinstance(bloc[col].dtype, pd.CategoricalDtype):
+            valeurs = bloc[col]
+            if pd.api.types.is_string_dtype(valeurs):
+                valeurs = valeurs.str.strip()
+            bloc[col] = valeurs.astype("category")
+    return bloc
+
+
+def compacter(df, numeriques=None, categories=()):
+    # Types compacts d'un DataFrame déjà chargé (table lue en base) : mêmes règles que lire_csv, sur place
+    return _compacter(df, numeriques or {}, set(categories))
+
+
+def empreinte_memoire(avant, apres):
+    # Rapport par colonne : type et Mo avant / après compactage, ligne Total en fin de tableau
+    def mo(df):
+        return df.memory_usage(deep=True, index=False) / 1024 ** 2
+
+    rapport = pd.DataFrame({
+        "Type avant": avant.dtypes.astype(str), "Mo avant": mo(avant),
+        "Type après": apres.dtypes.astype(str), "Mo après": mo(apres),
+    })
+    rapport.loc["Total"] = ["", rapport["Mo avant"].sum(), "", rapport["Mo après"].sum()]
+    rapport["Gain (%)"] = (1 - rapport["Mo après"] / rapport["Mo avant"]) * 100
+    return rapport.round({"Mo avant": 2, "Mo après": 2, "Gain (%)": 1})
+
+
+def _assembler(blocs, categories):
+    if len(blocs) == 1:
+        return blocs[0]
+    # Les catégories diffèrent d'un bloc à l'autre : union avant concaténation
+    unions = {
+        col: union_categoricals([b[col] for b in blocs], ignore_order=True)
+        for col in blocs[0].columns if col in categories
+    }
+    df = pd.concat([b.drop(columns=list(unions)) for b in blocs], ignore_index=True)
+    for col, valeurs in unions.items():
+        df[col] = valeurs
+    return df[list(blocs[0].columns)]
+
+
+def lire_csv(fichier, colonnes=None, numeriques=None, categories=(), sep=";",
+             taille_bloc=TAILLE_BLOC, max_memoire_mo=MAX_MEMOIRE_MO):
+    # Lecture par blocs d'un CSV uploadé : colonnes utiles seulement, types compacts, mémoire plafonnée.
+    # numeriques : {colonne: dtype} ; categories : colonnes texte à faible cardinalité
+    numeriques = numeriques or {}
+    categories = set(categories)
+    usecols = None
+    if colonnes is not None:
+        voulues = set(colonnes)
+        usecols = lambda c: c.strip() in voulues  # noqa: E731
+
+    encodage = detecter_encodage(fichier)
+    for essai in (encodage, "latin1"):
+        fichier.seek(0)
+        blocs = []
+        memoire = 0
+        try:
+            lecteur = pd.read_csv(
+                fichier, sep=sep, encoding=essai, usecols=usecols,
+                dtype=str, chunksize=taille_bloc,
+            )
+            for bloc in lecteur:
+                bloc = _compacter(bloc, numeriques, categories)
+                memoire += bloc.memory_usage(deep=True).sum()
+                if memoire > max_memoire_mo * 1024 ** 2:
+                    raise MemoryError(
+                        f"Fichier trop volumineux : plus de {max_memoire_mo} Mo une fois chargé."
+                    )
+                blocs.append(bloc)
+            break
+        except UnicodeDecodeError:
+            # Échantillon UTF-8 mais suite du fichier en latin1 : on relit en latin1
+            if essai == "latin1":
+                raise
+
+    if not blocs:
+        return pd.DataFrame(columns=list(colonnes or []))
+    return _assembler(blocs, categories)
+
+
+# === Schémas des fichiers uploadés par les pages
+NUMERIQUES_LOCALITES = {
+    "Latitude": np.float64, "Longitude": np.float64,
+    "Latitude_agence": np.float64, "Longitude_agence": np.float64,
+    "Distance (km)": np.float64, "distance_km": np.float64,
+}
+CATEGORIES_LOCALITES = ["Zone", "Code agence", "zone", "code_agence"]
+
+COLONNES_EXPEDITIONS = ["Code agence", "Zone", "Commune", "Poids", "UM"]
+NUMERIQUES_EXPEDITIONS = {"Poids": np.float64, "UM": np.float64}
+CATEGORIES_EXPEDITIONS = ["Code agence", "Zone", "Commune"]
+
+# === Tables d'expéditions lues en base (tranche_zone, pal_tranche) : libellés en catégories,
+# coordonnées en float32 ; poids et UM restent en float64 (sommes des tarifs et des cubes)
+NUMERIQUES_TABLES_EXPEDITIONS = {
+    "Poids": np.float64, "UM": np.float64, "Latitude": np.float32, "Longitude": np.float32,
+}
+CATEGORIES_TABLES_EXPEDITIONS = [
+    "Zone", "Code agence", "Commune", "Ville", "Agence entree reseau", "Agence sortie reseau", "PS",
+]
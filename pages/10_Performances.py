@@ -0,0 +1,97 @@
+import streamlit as st
+import plotly.express as px
+from performance import get_registre, get_registre_sql, TAILLE_TAMPON, TAILLE_JOURNAL_SQL
+from database import SEUIL_REQUETE_LENTE
+
+# === Authentification
+if "authenticated" not in st.session_state or not st.session_state["authenticated"]:
+    st.warning("🚫 Accès non autorisé. Veuillez vous connecter depuis la page principale.")
+    st.stop()
+
+# === Vérification du rôle
+if st.session_state.get("role") != "admin":
+    st.error("🔒 Accès réservé à l'administrateur.")
+    st.stop()
+
+st.title("⏱️ Performances des pages")
+st.caption(
+    f"Mesures du processus Streamlit depuis son démarrage : percentiles sur les {TAILLE_TAMPON} dernières "
+    "mesures de chaque section, appels et lignes cumulés. Les chargements de database.py ne sont "
+    "mesurés que lorsqu'ils ne sont pas servis par le cache."
+)
+
+registre = get_registre()
+registre_sql = get_registre_sql()
+stats = registre.statistiques()
+
+if stats.empty:
+    st.info("ℹ️ Aucune mesure pour l'instant : parcourez les pages pour en collecter.")
+    st.stop()
+
+# === Filtre par page
+pages = sorted(stats["Page"].unique())
+selected_pages = st.multiselect("📄 Pages", pages, default=pages)
+stats = stats[stats["Page"].isin(selected_pages)].sort_values("p95 (ms)", ascending=False)
+
+col1, col2, col3 = st.columns(3)
+col1.metric("Sections mesurées", len(stats))
+col2.metric("Appels", int(stats["Appels"].sum()))
+col3.metric("Temps cumulé (s)", f"{stats['Total (s)'].sum():.1f}")
+
+st.dataframe(stats, use_container_width=True, hide_index=True)
+
+# === Sections les plus lentes
+top = stats.head(20)
+top = top.assign(Section=top["Page"] + " · " + top["Section"])
+fig = px.bar(
+    top, x="p95 (ms)", y="Section", orientation="h", hover_data=["p50 (ms)", "Max (ms)", "Appels"],
+    title="🐢 Sections les plus lentes (p95)"
+)
+fig.update_layout(yaxis={"categoryorder": "total ascending"})
+st.plotly_chart(fig)
+
+col1, col2 = st.columns(2)
+col1.download_button(
+    "📥 Exporter les mesures (CSV)",
+    data=stats.to_csv(index=False, sep=";").encode("utf-8"),
+    file_name="performances_pages.csv",
+    mime="text/csv"
+)
+if col2.button("🗑️ Réinitialiser les mesures"):
+    registre.reinitialiser()
+    registre_sql.reinitialiser()
+    st.rerun()
+
+# === Requêtes SQL
+st.subheader("🗄️ Requêtes SQL")
+st.caption(
+    f"{TAILLE_JOURNAL_SQL} dernières requêtes émises par le moteur de database.py. Octets : taille en mémoire "
+    f"des données reçues (lectures DataFrame). Requêtes lentes : au-delà de {SEUIL_REQUETE_LENTE * 1000:.0f} ms, "
+    "également signalées dans les logs du serveur."
+)
+stats_sql = registre_sql.statistiques()
+stats_sql = stats_sql[stats_sql["Page"].isin(selected_pages)].sort_values("Total (s)", ascending=False)
+if stats_sql.empty:
+    st.info("ℹ️ Aucune requête SQL pour les pages sélectionnées (données servies par le cache ou les snapshots).")
+else:
+    journal = registre_sql.journal()
+    lentes = journal[
+        journal["Page"].isin(selected_pages) & (journal["Durée (ms)"] >= SEUIL_REQUETE_LENTE * 1000)
+    ]
+
+    col1, col2, col3 = st.columns(3)
+    col1.metric("Requêtes", int(stats_sql["Appels"].sum()))
+    col2.metric("Requêtes lentes", len(lentes))
+    col3.metric("Données reçues (Mo)", f"{stats_sql['Octets'].sum() / 1e6:.1f}")
+
+    st.dataframe(stats_sql, use_container_width=True, hide_index=True)
+    if not lentes.empty:
+        st.markdown("**🐢 Requêtes lentes**")
+        st.dataframe(lentes.sort_values("Durée (ms)", ascending=False), use_container_width=True, hide_index=True)
+
+    st.download_button(
+        "📥 Exporter le journal SQL (CSV)",
+        data=journal.to_csv(index=False, sep=";").encode("utf-8"),
+        file_name="requetes_sql.csv",
+        mime="text/csv"
+    )
@@ -1,19 +1,24 @@
 import streamlit as st
-import pandas as pd
 import plotly.express as px
-import folium
-from streamlit_folium import st_folium
-from math import radians, cos, sin, asin, sqrt
-from folium.plugins import Search
-from folium import FeatureGroup
+import hashlib
 
 from database import (
     get_zones,
+    get_data_version,
+    get_enveloppes,
     insert_localite,
     update_localite,
     delete_localite,
+    bulk_upsert_localites,
     log_action,
 )
+from analytics.geo import haversine, enveloppes_agences
+from analytics.zones import ZONES, zone_suggeree, coordonnees_agence, comptage_zones, distances_par_zone
+from cartes import carte_agence
+from performance import suivre_page, mesure
+from ingestion import lire_csv, NUMERIQUES_LOCALITES, CATEGORIES_LOCALITES
+
+suivre_page(__file__)
 
 # === Authentification requise ===
 if "authenticated" not in st.session_state or not st.session_state["authenticated"]:
@@ -26,12 +31,20 @@ st.title("🔎 Analyse des Zones de Livraison")
 
 uploaded_file = st.file_uploader("📄 Uploader un fichier CSV (optionnel)", type=["csv"])
 
-if uploaded_file:
-    df = pd.read_csv(uploaded_file, sep=";", encoding="latin1")
-    st.success("✅ Fichier CSV chargé")
-else:
-    df = get_zones()
-    st.success("✅ Données chargées depuis Supabase")
+with mesure("Chargement des localités") as m:
+    if uploaded_file:
+        try:
+            df = lire_csv(uploaded_file, numeriques=NUMERIQUES_LOCALITES, categories=CATEGORIES_LOCALITES)
+        except MemoryError as e:
+            st.error(f"❌ {e}")
+            st.stop()
+        version_donnees = hashlib.sha1(uploaded_file.getvalue()).hexdigest()
+        st.success("✅ Fichier CSV chargé")
+    else:
+        df = get_zones()
+        version_donnees = get_data_version("zones_localites1")
+        st.success("✅ Données chargées depuis Supabase")
+    m["lignes"] = len(df)
 
 # Renommer les colonnes pour correspondre à l'affichage
 df = df.rename(columns={
@@ -49,14 +62,6 @@ df.columns = df.columns.str.strip()
 
 # === Ajouter une localité (admin uniquement) ===
 if role == "admin":
-    def haversine(lat1, lon1, lat2, lon2):
-        R = 6371
-        dlat = radians(lat2 - lat1)
-        dlon = radians(lon2 - lon1)
-        a = sin(dlat / 2) ** 2 + cos(radians(lat1)) * cos(radians(lat2)) * sin(dlon / 2) ** 2
-        c = 2 * asin(sqrt(a))
-        return R * c
-    
     with st.form("ajout_localite"):
         commune = st.text_input("Commune")
         agences_existantes = df["Code agence"].dropna().unique()
@@ -66,31 +71,14 @@ if role == "admin":
     
         # Obtenir coordonnées agence sélectionnée
         try:
-            coord_ag = (
-                df[df["Code agence"] == code_agence]
-                .groupby("Code agence")[["Latitude_agence", "Longitude_agence"]]
-                .mean()
-                .reset_index()
-                .iloc[0]
-            )
-            latitude_ag = coord_ag["Latitude_agence"]
-            longitude_ag = coord_ag["Longitude_agence"]
+            latitude_ag, longitude_ag = coordonnees_agence(df, code_agence)
 
-    
             # IA : calculer la distance
-            distance_calculee = round(haversine(latitude, longitude, latitude_ag, longitude_ag), 2)
+            distance_calculee = round(float(haversine(latitude, longitude, latitude_ag, longitude_ag)), 2)
             st.markdown(f"📏 **Distance calculée automatiquement : {distance_calculee} km**")
     
             # IA : suggestion zone automatique
-            if distance_calculee <= 20:
-                zone_suggeree = "Zone 1"
-            elif distance_calculee <= 40:
-                zone_suggeree = "Zone 2"
-            else:
-                zone_suggeree = "Zone 3"
-    
-            zone = st.selectbox("Zone", ["Zone 1", "Zone 2", "Zone 3"],
-                                index=["Zone 1", "Zone 2", "Zone 3"].index(zone_suggeree))
+            zone = st.selectbox("Zone", ZONES, index=ZONES.index(zone_suggeree(distance_calculee)))
     
         except IndexError:
             st.error("⚠️ Impossible de trouver les coordonnées de l'agence. Vérifiez les données.")
@@ -126,7 +114,7 @@ if role == "admin":
             code_agence = st.text_input("Code Agence", value=selected_data["Code agence"])
             latitude = st.number_input("Latitude", value=selected_data["Latitude"], format="%.6f")
             longitude = st.number_input("Longitude", value=selected_data["Longitude"], format="%.6f")
-            zone = st.selectbox("Zone", ["Zone 1", "Zone 2", "Zone 3"], index=["Zone 1", "Zone 2", "Zone 3"].index(selected_data["Zone"]))
+            zone = st.selectbox("Zone", ZONES, index=ZONES.index(selected_data["Zone"]))
             distance = st.number_input("Distance (km)", value=selected_data["Distance (km)"], format="%.2f")
             latitude_ag = st.number_input("Latitude Agence", value=selected_data["Latitude_agence"], format="%.6f")
             longitude_ag = st.number_input("Longitude Agence", value=selected_data["Longitude_agence"], format="%.6f")
@@ -144,6 +132,42 @@ if role == "admin":
                 st.success("🗑️ Localité supprimée.")
                 st.cache_data.clear()
 
+# === Import en masse de localités (admin uniquement) ===
+if role == "admin":
+    st.subheader("📥 Import en masse de localités")
+    with st.form("import_localites"):
+        fichier_import = st.file_uploader(
+            "CSV au format normatrans_zones_final_localites.csv", type=["csv"], key="import_localites_csv"
+        )
+        supprimer_absentes = st.checkbox(
+            "Supprimer les localités absentes du fichier (agences présentes dans le fichier uniquement)"
+        )
+        col1, col2 = st.columns(2)
+        previsualiser = col1.form_submit_button("🔍 Prévisualiser")
+        appliquer = col2.form_submit_button("✅ Appliquer")
+
+    if (previsualiser or appliquer) and fichier_import is not None:
+        try:
+            df_import = lire_csv(fichier_import)
+            resume = bulk_upsert_localites(df_import, delete_missing=supprimer_absentes, dry_run=previsualiser)
+        except (ValueError, MemoryError) as e:
+            st.error(f"❌ {e}")
+        else:
+            col1, col2, col3, col4 = st.columns(4)
+            col1.metric("Ajoutées", resume["inserees"])
+            col2.metric("Modifiées", resume["modifiees"])
+            col3.metric("Inchangées", resume["inchangees"])
+            col4.metric("Supprimées", resume["supprimees"])
+            if appliquer:
+                log_action(
+                    st.session_state["username"], "Import localités",
+                    f"{fichier_import.name} | +{resume['inserees']} ~{resume['modifiees']} -{resume['supprimees']}"
+                )
+                st.success("✅ Import appliqué.")
+                st.cache_data.clear()
+            else:
+                st.info("ℹ️ Prévisualisation : aucune modification enregistrée.")
+
 # === Statistiques et carte ===
 required_cols = ["Commune", "Code agence", "Latitude", "Longitude", "Zone", "Distance (km)", "Latitude_agence", "Longitude_agence"]
 df = df.dropna(subset=["Latitude", "Longitude"])
@@ -153,67 +177,53 @@ df_agence = df[df["Code agence"] == agence_selectionnee]
 coord_agence = df_agence[["Latitude_agence", "Longitude_agence"]].iloc[0]
 
 st.subheader("📊 Statistiques générales")
-col1, col2, col3, col4 = st.columns(4)
-col1.metric("Nombre de localités", len(df_agence))
-col2.metric("Zone 1", len(df_agence[df_agence["Zone"] == "Zone 1"]))
-col3.metric("Zone 2", len(df_agence[df_agence["Zone"] == "Zone 2"]))
-col4.metric("Zone 3", len(df_agence[df_agence["Zone"] == "Zone 3"]))
-
-fig = px.histogram(df_agence, x="Zone", color="Zone", title="📈 Répartition des localités par zone")
-st.plotly_chart(fig)
-
-st.write("### 📏 Distances moyennes par zone")
-st.dataframe(
-    df_agence.groupby("Zone")["Distance (km)"]
-    .agg(["count", "mean"])
-    .rename(columns={"count": "Nb localités", "mean": "Distance moyenne (km)"})
-    .round(2)
-)
+with mesure("Statistiques", lignes=len(df_agence)):
+    nb_zones = comptage_zones(df_agence)
+    col1, col2, col3, col4 = st.columns(4)
+    col1.metric("Nombre de localités", len(df_agence))
+    col2.metric("Zone 1", int(nb_zones["Zone 1"]))
+    col3.metric("Zone 2", int(nb_zones["Zone 2"]))
+    col4.metric("Zone 3", int(nb_zones["Zone 3"]))
 
+    fig = px.histogram(df_agence, x="Zone", color="Zone", title="📈 Répartition des localités par zone")
+    st.plotly_chart(fig)
 
-st.subheader("🗺️ Carte interactive des localités")
-
-# Créer la carte centrée sur l'agence
-m = folium.Map(location=[coord_agence["Latitude_agence"], coord_agence["Longitude_agence"]], zoom_start=9)
+    st.write("### 📏 Distances moyennes par zone")
+    st.dataframe(distances_par_zone(df_agence))
 
-# Marker pour l’agence
-folium.CircleMarker(
-    location=[coord_agence["Latitude_agence"], coord_agence["Longitude_agence"]],
-    radius=8, color="black", fill=True, fill_opacity=1.0,
-    popup=f"Agence : {agence_selectionnee}"
-).add_to(m)
 
-# === Groupe de localités pour la recherche
-localites_group = FeatureGroup(name="Localités")
+st.subheader("🗺️ Carte interactive des localités")
 
-colors = {"Zone 1": "green", "Zone 2": "orange", "Zone 3": "red"}
+affichage = st.radio(
+    "Affichage", ["Zones (polygones)", "Localités (points)", "Zones + localités"], horizontal=True
+)
 
-for _, row in df_agence.iterrows():
-    folium.CircleMarker(
-        location=[row["Latitude"], row["Longitude"]],
-        radius=5,
-        color=colors.get(row["Zone"], "gray"),
-        fill=True,
-        fill_opacity=0.7,
-        popup=row["Commune"],
-        tooltip=row["Commune"]
-    ).add_to(localites_group)
 
-# Ajouter le groupe à la carte
-localites_group.add_to(m)
+@st.cache_data(show_spinner=False)
+def enveloppes_fichier(version, _df):
+    return enveloppes_agences(_df)
 
-# === Ajout de la barre de recherche
-Search(
-    layer=localites_group,
-    search_label='Commune',
-    placeholder="🔍 Chercher une localité...",
-    collapsed=False
-).add_to(m)
 
-# Afficher la carte dans Streamlit
-st_folium(m, width=1100, height=600)
+# Carte mise en cache par agence, affichage, source et version des données : reconstruite seulement si les
+# localités changent (les DataFrames, non hachés, sont déterminés par la source et la version)
+@st.cache_data(show_spinner=False, max_entries=64)
+def carte_html(agence, affichage, version, depuis_fichier, _df, _df_agence, lat_ag, lon_ag):
+    df_enveloppes = None
+    if affichage != "Localités (points)":
+        tout = enveloppes_fichier(version, _df) if depuis_fichier else get_enveloppes("zones_localites1")
+        df_enveloppes = tout[(tout["Code agence"] == agence) & tout["Zone"].notna()]
+    points = affichage != "Zones (polygones)"
+    return carte_agence(_df_agence, agence, lat_ag, lon_ag, df_enveloppes, points).get_root().render()
 
 
+with mesure("Carte", lignes=len(df_agence)):
+    st.iframe(
+        carte_html(
+            agence_selectionnee, affichage, version_donnees, uploaded_file is not None, df, df_agence,
+            float(coord_agence["Latitude_agence"]), float(coord_agence["Longitude_agence"])
+        ),
+        width=1100, height=600
+    )
 
 st.download_button(
     label="📥 Télécharger les données de cette agence",
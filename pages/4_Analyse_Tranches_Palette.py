@@ -1,7 +1,13 @@
 import streamlit as st
-import pandas as pd
+import io
 import plotly.express as px
-from database import get_palette
+from database import get_cube_palette
+from analytics.tranches import crosstab, cube_palette, repartitions
+from analytics.statistiques import filtrer, top_communes, stats_palette, detail_palette, comptages
+from performance import suivre_page, mesure
+from ingestion import lire_csv, COLONNES_EXPEDITIONS, NUMERIQUES_EXPEDITIONS, CATEGORIES_EXPEDITIONS
+
+suivre_page(__file__)
 
 if "authenticated" not in st.session_state or not st.session_state["authenticated"]:
     st.warning("🚫 Accès non autorisé. Veuillez vous connecter depuis la page principale.")
@@ -14,131 +20,110 @@ st.title("📦 Analyse des Tranches de Palette (UM) par Zone")
 
 uploaded_file = st.file_uploader("📄 Uploader le fichier des livraisons (pal_tranche.csv)", type=["csv"])
 
+
+@st.cache_data(show_spinner=False)
+def cube_depuis_fichier(contenu):
+    return cube_palette(lire_csv(
+        io.BytesIO(contenu), colonnes=COLONNES_EXPEDITIONS,
+        numeriques=NUMERIQUES_EXPEDITIONS, categories=CATEGORIES_EXPEDITIONS,
+    ))
+
+
+# Aucune vue ligne à ligne sur cette page : tout est calculé sur le cube agence x zone x commune x tranche UM,
+# agrégé par la base (GROUP BY) une fois par version des données
 if uploaded_file:
-    df = pd.read_csv(uploaded_file, sep=";", encoding="latin1")
+    with mesure("Chargement du cube") as m:
+        try:
+            cube = cube_depuis_fichier(uploaded_file.getvalue())
+        except MemoryError as e:
+            st.error(f"❌ {e}")
+            st.stop()
+        m["lignes"] = len(cube)
+    dimensions = cube
+else:
+    # Seules les colonnes des filtres sont lues pour construire les listes déroulantes
+    dimensions = get_cube_palette(colonnes=["Zone", "Code agence"])
+
+# === Filtres optionnels ===
+zones = dimensions["Zone"].dropna().unique()
+agences = dimensions["Code agence"].dropna().unique() if "Code agence" in dimensions.columns else []
+
+col1, col2 = st.columns(2)
+selected_zone = col1.selectbox("🌟 Filtrer par zone", ["Toutes"] + list(zones))
+selected_agence = col2.selectbox(
+    "🏢 Filtrer par agence",
+    ["Toutes"] + list(agences) if len(agences) > 0 else ["Aucune"]
+)
 
+if uploaded_file:
+    with mesure("Filtres", lignes=len(cube)):
+        cube_filtre = filtrer(cube, selected_zone, selected_agence)
 else:
-    df = get_palette()
+    # Filtres appliqués à la lecture du cube : seules les lignes de la zone / agence choisie sont chargées
+    with mesure("Chargement du cube") as m:
+        cube_filtre = get_cube_palette(
+            zone=None if selected_zone == "Toutes" else selected_zone,
+            agence=None if selected_agence in ("Toutes", "Aucune") else selected_agence,
+        )
+        m["lignes"] = len(cube_filtre)
     st.success("✅ Données chargées depuis Supabase")
 
-    # Nettoyage
-    df.columns = df.columns.str.strip()
-    df["UM"] = df["UM"].astype(str).str.replace(",", ".").astype(float)
-    df["Zone"] = df["Zone"].astype(str).str.strip()
-    if "Code agence" in df.columns:
-        df["Code agence"] = df["Code agence"].astype(str).str.strip()
-
-    # Tranches UM
-    bins = [0, 1, 2, 3, 4, 5, 6, float("inf")]
-    labels = ["1 palette", "2 palettes", "3 palettes", "4 palettes", "5 palettes", "6 palettes", "+6 palettes"]
-    df["Tranche_UM"] = pd.cut(df["UM"], bins=bins, labels=labels, right=True)
-    df["Tranche_UM"] = pd.Categorical(df["Tranche_UM"], categories=labels, ordered=True)
-    df = df[df["Tranche_UM"].notna()]
-
-    # === Filtres optionnels ===
-    zones = df["Zone"].dropna().unique()
-    agences = df["Code agence"].dropna().unique() if "Code agence" in df.columns else []
-
-    col1, col2 = st.columns(2)
-    selected_zone = col1.selectbox("🌟 Filtrer par zone", ["Toutes"] + list(zones))
-    selected_agence = col2.selectbox(
-        "🏢 Filtrer par agence",
-        ["Toutes"] + list(agences) if len(agences) > 0 else ["Aucune"]
-    )
-
-    df_filtered = df.copy()
-    if selected_zone != "Toutes":
-        df_filtered = df_filtered[df_filtered["Zone"] == selected_zone]
-    if selected_agence != "Toutes" and "Code agence" in df_filtered.columns:
-        df_filtered = df_filtered[df_filtered["Code agence"] == selected_agence]
-
-    st.markdown(f"🔎 **Filtres actifs :** Zone = `{selected_zone}` | Agence = `{selected_agence}`")
-
-    # === Répartition par zone
-    st.subheader("📊 Répartition (%) des tranches de palette par zone")
-    pivot = df_filtered.groupby(["Zone", "Tranche_UM"]).size().reset_index(name="Nb_exp")
-    totaux = pivot.groupby("Zone")["Nb_exp"].sum().reset_index(name="Total")
-    result = pd.merge(pivot, totaux, on="Zone")
-    result["Pourcentage"] = (result["Nb_exp"] / result["Total"] * 100).round(2)
-    tableau = result.pivot(index="Zone", columns="Tranche_UM", values="Pourcentage").fillna(0)
-    tableau = tableau[tableau.index.notna()]  # ✅ corriger ligne NaN
-    st.dataframe(tableau)
-
-    st.download_button(
-        "📥 Télécharger la répartition par zone",
-        data=tableau.to_csv().encode("utf-8"),
-        file_name="repartition_tranches_palette_par_zone.csv",
-        mime="text/csv"
-    )
-
-    # === Répartition des zones par tranche
-    st.subheader("🔁 Répartition (%) des zones par tranche de palette (UM)")
-    pivot_inv = df_filtered.groupby(["Tranche_UM", "Zone"]).size().reset_index(name="Nb_exp")
-    totaux_tranche = pivot_inv.groupby("Tranche_UM")["Nb_exp"].sum().reset_index(name="Total")
-    result_inv = pd.merge(pivot_inv, totaux_tranche, on="Tranche_UM")
-    result_inv["Pourcentage"] = (result_inv["Nb_exp"] / result_inv["Total"] * 100).round(2)
-    tableau_inverse = result_inv.pivot(index="Tranche_UM", columns="Zone", values="Pourcentage").fillna(0)
-    tableau_inverse = tableau_inverse[tableau_inverse.index.notna()]  # ✅ corriger ligne NaN
-    st.dataframe(tableau_inverse)
-
-    # === Détail global
-    st.subheader("📋 Détail global par agence, zone et commune")
-    group_cols = ["Zone", "Commune"]
-    if "Code agence" in df_filtered.columns:
-        group_cols.insert(0, "Code agence")
-
-    detail = df_filtered.groupby(group_cols).agg(
-        Nb_expéditions=("UM", "count"),
-        UM_total=("UM", "sum"),
-        UM_moyenne=("UM", "mean")
-    ).reset_index().round(2)
-
-    if st.checkbox("📄 Afficher le détail des données"):
-        st.dataframe(detail)
-
-    # === Top communes
-    if "Commune" in detail.columns:
-        st.subheader("🏆 Top 20 communes avec le plus d'expéditions")
-        top_communes = detail.groupby("Commune")["Nb_expéditions"].sum().nlargest(20).reset_index()
-        st.bar_chart(top_communes.set_index("Commune")["Nb_expéditions"])
-
-    # === Statistiques globales
-    st.subheader("⚖️ Statistiques globales")
-    stats_zone = df_filtered.groupby("Zone").agg(
-        Nb_expéditions=("UM", "count"),
-        UM_total=("UM", "sum"),
-        UM_moyenne=("UM", "mean")
-    ).round(2)
-    st.dataframe(stats_zone)
-
-    if "Code agence" in df_filtered.columns:
+st.markdown(f"🔎 **Filtres actifs :** Zone = `{selected_zone}` | Agence = `{selected_agence}`")
+
+# === Répartition par zone
+st.subheader("📊 Répartition (%) des tranches de palette par zone")
+with mesure("Crosstab zones x tranches", lignes=len(cube_filtre)):
+    nb_zone_tranche = crosstab(cube_filtre["Zone"], cube_filtre["Tranche_UM"], poids=cube_filtre["Nb_exp"])
+    distributions = repartitions(nb_zone_tranche)
+tableau = distributions["lignes"]
+st.dataframe(tableau)
+
+st.download_button(
+    "📥 Télécharger la répartition par zone",
+    data=tableau.to_csv().encode("utf-8"),
+    file_name="repartition_tranches_palette_par_zone.csv",
+    mime="text/csv"
+)
+
+# === Répartition des zones par tranche
+st.subheader("🔁 Répartition (%) des zones par tranche de palette (UM)")
+tableau_inverse = distributions["colonnes"].T
+st.dataframe(tableau_inverse)
+
+# === Détail global
+st.subheader("📋 Détail global par agence, zone et commune")
+with mesure("Détail agence x zone x commune", lignes=len(cube_filtre)):
+    detail = detail_palette(cube_filtre)
+
+if st.checkbox("📄 Afficher le détail des données"):
+    st.dataframe(detail)
+
+# === Top communes
+if "Commune" in detail.columns:
+    st.subheader("🏆 Top 20 communes avec le plus d'expéditions")
+    st.bar_chart(top_communes(detail).set_index("Commune")["Nb_expéditions"])
+
+# === Statistiques globales
+st.subheader("⚖️ Statistiques globales")
+with mesure("Statistiques", lignes=len(cube_filtre)):
+    st.dataframe(stats_palette(cube_filtre, "Zone"))
+
+    if "Code agence" in cube_filtre.columns:
         st.subheader("🏢 Statistiques par Agence")
-        stats_agence = df_filtered.groupby("Code agence").agg(
-            Nb_expéditions=("UM", "count"),
-            UM_total=("UM", "sum"),
-            UM_moyenne=("UM", "mean")
-        ).round(2)
-        st.dataframe(stats_agence)
-
-    # === Graphiques camembert
-    st.subheader("🥧 Répartition globale des tranches de palette")
-    pie_tranches = df_filtered["Tranche_UM"].value_counts().sort_index().reset_index()
-    pie_tranches.columns = ["Tranche_UM", "Nb_exp"]
+        st.dataframe(stats_palette(cube_filtre, "Code agence"))
+
+# === Graphiques camembert
+st.subheader("🥧 Répartition globale des tranches de palette")
+with mesure("Graphiques", lignes=len(cube_filtre)):
+    pie_tranches = comptages(cube_filtre, "Tranche_UM", trier=True)
     fig = px.pie(pie_tranches, names="Tranche_UM", values="Nb_exp", title="Répartition des tranches UM")
     st.plotly_chart(fig)
 
-    pie_zones = df_filtered["Zone"].value_counts().reset_index()
-    pie_zones.columns = ["Zone", "Nb_exp"]
+    pie_zones = comptages(cube_filtre, "Zone")
     fig = px.pie(pie_zones, names="Zone", values="Nb_exp", title="Répartition par zone")
     st.plotly_chart(fig)
 
-    if "Code agence" in df_filtered.columns:
-        pie_agence = df_filtered["Code agence"].value_counts().reset_index()
-        pie_agence.columns = ["Code agence", "Nb_exp"]
+    if "Code agence" in cube_filtre.columns:
+        pie_agence = comptages(cube_filtre, "Code agence")
         fig = px.pie(pie_agence, names="Code agence", values="Nb_exp", title="Répartition par agence")
         st.plotly_chart(fig)
-
-   
-
-
-
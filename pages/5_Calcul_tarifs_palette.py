@@ -1,6 +1,14 @@
 import streamlit as st
+import numpy as np
 import pandas as pd
-import math
+import plotly.express as px
+from sqlalchemy.exc import SQLAlchemyError
+from analytics.tarifs import balayage_tarifs, calculer_tarifs, coefficients_racine, repartition_depuis_cube
+from database import get_cube_palette, get_data_version
+from performance import suivre_page, mesure
+from analytics.tranches import LABELS_UM
+
+suivre_page(__file__)
 
 # === Authentification
 if "authenticated" not in st.session_state or not st.session_state["authenticated"]:
@@ -9,7 +17,7 @@ if "authenticated" not in st.session_state or not st.session_state["authenticate
 
 st.title("💶 Calcul des Tarifs par Tranche")
 
-# === Répartition (en %) des zones par tranche
+# === Répartition (en %) des zones par tranche (valeurs de référence)
 repartition = {
     "Tranche de poids": ["1 P", "2 P", "3 P", "4 P", "5 P", "6 P", "P sup"],
     "Zone 1": [47.58, 47.96, 48.94, 51.02, 52.20, 56.41, 84.40],
@@ -17,12 +25,45 @@ repartition = {
     "Zone 3": [16.51, 17.18, 16.52, 15.83, 20.00, 13.68, 4.26]
 }
 
+# Tranches UM de l'analyse palette -> tranches tarifaires
+TRANCHES_TARIF = dict(zip(LABELS_UM, repartition["Tranche de poids"]))
+
 # === Tarifs forfaitaires de base (pondérés)
 tarifs_forfaitaires = {
     "1 P": 34.00, "2 P": 54.00, "3 P": 69.00, "4 P": 83.00,
     "5 P": 97.00, "6 P": 111.00, "P sup": 9.60
 }
 
+# === Répartition des zones par tranche : expéditions réelles ou valeurs de référence
+df_reference = pd.DataFrame(repartition).set_index("Tranche de poids")
+
+
+@st.cache_data(show_spinner=False)
+def repartition_reelle(version, agence):
+    # Agrégation mise en cache par version des données et agence
+    return repartition_depuis_cube(
+        get_cube_palette(), "Tranche_UM", agence=agence, libelles_tranches=TRANCHES_TARIF, reference=df_reference
+    )
+
+
+st.markdown("### Répartition des zones par tranche")
+source = st.radio("Source de la répartition", ["Expéditions réelles", "Valeurs de référence"], horizontal=True)
+df, volumes = df_reference, None
+with mesure("Répartition des zones"):
+    if source == "Expéditions réelles":
+        try:
+            cube = get_cube_palette()
+            agences = sorted(cube["Code agence"].dropna().astype(str).unique()) if "Code agence" in cube.columns else []
+            agence = st.selectbox("🏢 Agence", ["Tout le réseau"] + agences) if agences else "Tout le réseau"
+            df, volumes = repartition_reelle(
+                get_data_version("pal_tranche"), None if agence == "Tout le réseau" else agence
+            )
+            st.caption(f"Calculée sur {int(volumes.sum())} expéditions ; tranches sans expédition : valeurs de référence.")
+        except (SQLAlchemyError, OSError, ValueError) as e:
+            st.warning(f"⚠️ Données indisponibles ({e}) : valeurs de référence utilisées.")
+            df, volumes = df_reference, None
+st.dataframe(df)
+
 # === Paramètres ajustables
 st.markdown("### Paramètres du modèle de calcul")
 a = st.number_input("Écart fixe (en €)", min_value=0.1, max_value=5.0, value=2.77, step=0.01)
@@ -35,46 +76,23 @@ distance_zone = {
 }
 
 # === Calcul des coefficients racine carrée
-base_distance = math.sqrt(distance_zone["Zone 1"])
-auto_coef_zone1 = math.sqrt(distance_zone["Zone 1"]) / base_distance
-auto_coef_zone2 = math.sqrt(distance_zone["Zone 2"]) / base_distance
-auto_coef_zone3 = math.sqrt(distance_zone["Zone 3"]) / base_distance
+auto_coefs = coefficients_racine(distance_zone)
 
 st.markdown("### Coefficients par zone (modifiables)")
 
 coef_zone1 = st.number_input("Coefficient Zone 1", min_value=0.1, max_value=5.0,
-                             value=round(auto_coef_zone1, 3), step=0.01)
+                             value=round(auto_coefs["Zone 1"], 3), step=0.01)
 
 coef_zone2 = st.number_input("Coefficient Zone 2", min_value=0.1, max_value=5.0,
-                             value=round(auto_coef_zone2, 3), step=0.01)
+                             value=round(auto_coefs["Zone 2"], 3), step=0.01)
 
 coef_zone3 = st.number_input("Coefficient Zone 3", min_value=0.1, max_value=5.0,
-                             value=round(auto_coef_zone3, 3), step=0.01)
+                             value=round(auto_coefs["Zone 3"], 3), step=0.01)
 
 
 # === Calcul des tarifs
-df = pd.DataFrame(repartition).set_index("Tranche de poids")
-
-resultats = []
-
-for tranche in df.index:
-    r1, r2, r3 = df.loc[tranche, "Zone 1"] / 100, df.loc[tranche, "Zone 2"] / 100, df.loc[tranche, "Zone 3"] / 100
-    forfait = tarifs_forfaitaires[tranche]
-    x = forfait - a * (coef_zone1 * r1 + coef_zone2 * r2 + coef_zone3 * r3)
-    z1 = round(x + coef_zone1 * a, 2)
-    z2 = round(x + coef_zone2 * a, 2)
-    z3 = round(x + coef_zone3 * a, 2)
-    total = round(r1 * z1 + r2 * z2 + r3 * z3, 2)
-
-    resultats.append({
-        "Tranche": tranche,
-        "Zone 1 (€)": z1,
-        "Zone 2 (€)": z2,
-        "Zone 3 (€)": z3,
-        "Total pondéré (€)": total
-    })
-
-df_resultats = pd.DataFrame(resultats)
+with mesure("Calcul des tarifs", lignes=len(df)):
+    df_resultats = calculer_tarifs(df, tarifs_forfaitaires, a, coef_zone1, coef_zone2, coef_zone3)
 
 # === Affichage
 st.subheader("📊 Résultats du calcul des tarifs")
@@ -87,3 +105,56 @@ st.download_button(
     file_name="tarifs_par_tranche.csv",
     mime="text/csv"
 )
+
+# === Exploration d'une grille de paramètres
+@st.cache_data(show_spinner=False, max_entries=8)
+def balayage(repartition, forfaits, tarifs_actuels, grille_a, grille_c2, grille_c3, coef_zone1, volumes):
+    cube, synthese = balayage_tarifs(
+        repartition, forfaits, tarifs_actuels, grille_a, grille_c2, grille_c3, coef_zone1=coef_zone1, volumes=volumes
+    )
+    return cube, synthese, cube.to_csv(index=False).encode("utf-8")
+
+
+with st.expander("🔬 Explorer une grille de paramètres (écart fixe × coefficients)"):
+    # Toute grille rend le forfait sur la répartition choisie : on cherche la plus proche des tarifs actuels
+    st.caption(
+        "Chaque combinaison rend le forfait sur la répartition ci-dessus ; elle est classée selon l'écart moyen "
+        "de ses tarifs aux tarifs actuels (paramètres du modèle appliqués à la répartition de référence), "
+        "pondéré par la part de chaque zone et le volume de chaque tranche."
+    )
+    col1, col2, col3 = st.columns(3)
+    plage_a = col1.slider("Écart fixe (€)", key="grille_a", min_value=0.1, max_value=5.0, value=(1.0, 4.0), step=0.01)
+    plage_c2 = col2.slider("Coefficient Zone 2", key="grille_c2", min_value=0.1, max_value=5.0, value=(1.0, 2.5), step=0.1)
+    plage_c3 = col3.slider("Coefficient Zone 3", key="grille_c3", min_value=0.1, max_value=5.0, value=(1.5, 3.0), step=0.1)
+    n_valeurs = st.slider("Nombre de valeurs par paramètre", 2, 25, 15)
+
+    grille_a = np.linspace(*plage_a, n_valeurs).round(3)
+    grille_c2 = np.linspace(*plage_c2, n_valeurs).round(3)
+    grille_c3 = np.linspace(*plage_c3, n_valeurs).round(3)
+    tarifs_actuels = calculer_tarifs(df_reference, tarifs_forfaitaires, a, coef_zone1, coef_zone2, coef_zone3).set_index("Tranche")
+    with mesure("Balayage des paramètres", lignes=len(df)):
+        cube, synthese, cube_csv = balayage(
+            df, tarifs_forfaitaires, tarifs_actuels, grille_a, grille_c2, grille_c3, coef_zone1=coef_zone1, volumes=volumes
+        )
+    st.caption(f"{len(synthese)} combinaisons évaluées.")
+
+    a_affiche = st.select_slider("Écart fixe affiché sur la carte de chaleur", options=[float(v) for v in np.unique(grille_a)])
+    heatmap = synthese[synthese["Écart fixe (€)"] == a_affiche].pivot(
+        index="Coef Zone 3", columns="Coef Zone 2", values="Écart moyen aux tarifs actuels (€)"
+    )
+    fig = px.imshow(
+        heatmap, origin="lower", aspect="auto", color_continuous_scale="RdYlGn_r",
+        labels={"color": "Écart moyen (€)"},
+        title=f"Écart moyen aux tarifs actuels — écart fixe = {a_affiche} €"
+    )
+    st.plotly_chart(fig)
+
+    st.write("### 🏅 Combinaisons les plus proches des tarifs actuels")
+    st.dataframe(synthese.nsmallest(20, "Écart moyen aux tarifs actuels (€)"))
+
+    st.download_button(
+        label="📥 Télécharger le cube complet",
+        data=cube_csv,
+        file_name="balayage_tarifs.csv",
+        mime="text/csv"
+    )
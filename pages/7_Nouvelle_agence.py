@@ -1,16 +1,19 @@
 import streamlit as st
 import pandas as pd
 import plotly.express as px
-import folium
-from streamlit_folium import st_folium
-from folium import FeatureGroup
-from folium.plugins import Search
 
 from database import (
     get_zones_nv_agence,
     get_zones,
-    get_coordonnees_agences
+    get_coordonnees_agences,
+    get_data_version,
+    get_enveloppes
 )
+from analytics.zones import ZONES, resumes_agences
+from cartes import carte_comparaison
+from performance import suivre_page, mesure
+
+suivre_page(__file__)
 
 # Authentification
 if "authenticated" not in st.session_state or not st.session_state["authenticated"]:
@@ -20,9 +23,11 @@ if "authenticated" not in st.session_state or not st.session_state["authenticate
 st.title("📊 Analyse & Comparaison - Nouvelle et Anciennes Agences")
 
 # 📥 Charger données Supabase
-df_nv = get_zones_nv_agence()
-df_old = get_zones()
-df_coords = get_coordonnees_agences()
+with mesure("Chargement des localités") as m:
+    df_nv = get_zones_nv_agence()
+    df_old = get_zones()
+    df_coords = get_coordonnees_agences()
+    m["lignes"] = len(df_nv) + len(df_old)
 
 if df_nv.empty or df_old.empty or df_coords.empty:
     st.error("❌ Données manquantes dans la base. Vérifiez vos tables.")
@@ -47,6 +52,18 @@ coords_agences = df_coords.set_index("Code agence")[["Latitude", "Longitude"]].t
 
 codes_agences = df_old["Code agence"].dropna().unique()
 
+version_donnees = get_data_version("zones_localites1", "zones_nv_agence", "cordonnee_agence")
+
+
+# Localités de toutes les agences + résumés par agence et par agence x zone, calculés une fois par version
+@st.cache_data(show_spinner=False, max_entries=4)
+def resumes(version, _df_nv, _df_old):
+    return resumes_agences(_df_nv, _df_old)
+
+
+with mesure("Résumés par agence", lignes=len(df_nv) + len(df_old)):
+    df_agences, par_agence, par_zone = resumes(version_donnees, df_nv, df_old)
+
 # Sélection agences à afficher
 selected_agences = st.multiselect(
     "🏢 Choisissez les agences à afficher",
@@ -58,48 +75,28 @@ if not selected_agences:
     st.info("ℹ️ Sélectionnez au moins une agence pour afficher les données.")
     st.stop()
 
-# Fusionner données sélectionnées
-dfs = []
-if "Nouvelle Agence" in selected_agences:
-    dfs.append(df_nv)
-
-for agence in selected_agences:
-    if agence != "Nouvelle Agence":
-        df_a = df_old[df_old["Code agence"] == agence].copy()
-        df_a["Agence"] = agence
-        dfs.append(df_a)
-
-df_all = pd.concat(dfs)
+# Données sélectionnées : simple filtre sur les localités déjà fusionnées
+df_all = df_agences[df_agences["Agence"].isin(selected_agences)]
+zones_selection = par_zone[par_zone["Agence"].isin(selected_agences)]
 
 # 📊 Statistiques générales
 st.subheader("📊 Statistiques générales")
-stats = df_all.groupby("Agence").agg(
-    Localités=("Commune", "count"),
-    Zone_1=("Zone", lambda x: (x == "Zone 1").sum()),
-    Zone_2=("Zone", lambda x: (x == "Zone 2").sum()),
-    Zone_3=("Zone", lambda x: (x == "Zone 3").sum()),
-    Distance_moyenne=("Distance (km)", "mean")
-).round(2).reset_index()
-
-st.dataframe(stats)
+stats = par_agence.reindex([a for a in selected_agences if a in par_agence.index])
+st.dataframe(stats.rename_axis("Agence").reset_index())
 
 # 📈 Histogramme
-fig = px.histogram(
-    df_all, x="Zone", color="Agence", barmode="group",
+fig = px.bar(
+    zones_selection, x="Zone", y="Localités", color="Agence", barmode="group",
     title="Répartition des localités par zone et par agence",
-    category_orders={"Zone": ["Zone 1", "Zone 2", "Zone 3"]}
+    category_orders={"Zone": ZONES}
 )
 st.plotly_chart(fig)
 
 # 📏 Moyennes par zone
-if "Distance (km)" in df_all.columns:
+if "Distance (km)" in zones_selection.columns:
     st.write("### 📏 Distances moyennes par zone (toutes agences)")
     st.dataframe(
-        df_all.groupby(["Agence", "Zone"])["Distance (km)"]
-        .mean()
-        .reset_index()
-        .round(2)
-        .pivot(index="Zone", columns="Agence", values="Distance (km)")
+        zones_selection.round(2).pivot(index="Zone", columns="Agence", values="Distance (km)")
     )
 else:
     st.warning("⚠️ Colonne 'Distance (km)' absente des données.")
@@ -107,72 +104,28 @@ else:
 # 🗺️ Carte interactive
 st.subheader("🗺️ Carte interactive")
 
-m = folium.Map(
-    location=[df_all["Latitude"].mean(), df_all["Longitude"].mean()],
-    zoom_start=8
+affichage = st.radio(
+    "Affichage", ["Zones (polygones)", "Localités (points)", "Zones + localités"], horizontal=True
 )
 
-# couleurs pour les marqueurs d'agences
-colors_agences = {
-    "Nouvelle Agence": "blue",
-}
-for idx, code in enumerate(codes_agences):
-    colors_agences[code] = ["green", "orange", "purple", "red", "gray"][idx % 5]
-
-# couleurs pour les localités par zone
-zone_colors = {
-    "Zone 1": "green",
-    "Zone 2": "orange",
-    "Zone 3": "red"
-}
-
-groups = {}
-
-for agence in selected_agences:
-    groups[agence] = FeatureGroup(name=agence)
-    subset = df_all[df_all["Agence"] == agence]
-
-    # 📍 Marqueur agence (coordonnées exactes si connues)
-    if agence == "Nouvelle Agence":
-        lat_ag, lon_ag = coords_agences.get("NT50X", {"Latitude": subset["Latitude"].mean(), "Longitude": subset["Longitude"].mean()}).values()
-    elif agence in coords_agences:
-        lat_ag, lon_ag = coords_agences[agence]["Latitude"], coords_agences[agence]["Longitude"]
-    else:
-        lat_ag, lon_ag = subset["Latitude"].mean(), subset["Longitude"].mean()
-
-    folium.Marker(
-        location=[lat_ag, lon_ag],
-        popup=f"📍 {agence}",
-        tooltip=agence,
-        icon=folium.Icon(color=colors_agences.get(agence, "gray"), icon="building")
-    ).add_to(m)
-
-    # 🔷 Localités colorées par zone
-    for _, row in subset.iterrows():
-        couleur_zone = zone_colors.get(row["Zone"], "gray")
-
-        folium.CircleMarker(
-            location=[row["Latitude"], row["Longitude"]],
-            radius=4,
-            color=couleur_zone,
-            fill=True,
-            fill_opacity=0.7,
-            popup=f"{row['Commune']} ({row['Zone']})",
-            tooltip=row["Commune"]
-        ).add_to(groups[agence])
-
-    groups[agence].add_to(m)
-
-Search(
-    layer=list(groups.values())[0],
-    search_label='Commune',
-    placeholder="🔍 Chercher une localité...",
-    collapsed=False
-).add_to(m)
-
-folium.LayerControl().add_to(m)
-
-st_folium(m, width=1100, height=600)
+
+# Carte mise en cache par combinaison d'agences, affichage et version des données
+@st.cache_data(show_spinner=False, max_entries=64)
+def carte_html(agences, affichage, version, _df_all, _coords_agences, _codes_agences):
+    df_enveloppes = None
+    if affichage != "Localités (points)":
+        df_enveloppes = pd.concat([get_enveloppes("zones_localites1"), get_enveloppes("zones_nv_agence")])
+    points = affichage != "Zones (polygones)"
+    return carte_comparaison(
+        _df_all, list(agences), _coords_agences, _codes_agences, df_enveloppes, points
+    ).get_root().render()
+
+
+with mesure("Carte", lignes=len(df_all)):
+    st.iframe(
+        carte_html(tuple(selected_agences), affichage, version_donnees, df_all, coords_agences, codes_agences),
+        width=1100, height=600
+    )
 
 # 📥 Télécharger les données
 st.download_button(
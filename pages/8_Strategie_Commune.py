@@ -1,8 +1,18 @@
+import hashlib
 import streamlit as st
 import pandas as pd
-from sklearn.cluster import KMeans
 import plotly.express as px
-from database import get_zones
+from database import get_zones, get_coordonnees_agences, get_cube_palette, get_data_version
+from analytics.clustering import ajuster_plage, SEUIL_MINIBATCH
+from analytics.strategie import (
+    expeditions_par_commune, localites_eloignees, clusters_eloignes, coordonnees_agences,
+    suggestions_reaffectation,
+)
+from analytics.implantation import implanter_agences, poids_par_commune, demande_communes, cle_commune, MAX_CANDIDATS
+from ingestion import lire_csv, NUMERIQUES_LOCALITES, CATEGORIES_LOCALITES
+from performance import suivre_page, mesure
+
+suivre_page(__file__)
 
 if "authenticated" not in st.session_state or not st.session_state["authenticated"]:
     st.warning("🚫 Accès non autorisé. Veuillez vous connecter depuis la page principale.")
@@ -13,10 +23,18 @@ st.title("🧠 Analyse Stratégique des Localités et Agences ")
 
 # === Chargement des données
 uploaded_file = st.file_uploader("📄 Upload un fichier CSV (optionnel)", type=["csv"])
-if uploaded_file:
-    df = pd.read_csv(uploaded_file, sep=";", encoding="latin1")
-else:
-    df = get_zones()
+with mesure("Chargement des localités") as m:
+    if uploaded_file:
+        try:
+            df = lire_csv(uploaded_file, numeriques=NUMERIQUES_LOCALITES, categories=CATEGORIES_LOCALITES)
+        except MemoryError as e:
+            st.error(f"❌ {e}")
+            st.stop()
+        version_donnees = hashlib.sha1(uploaded_file.getvalue()).hexdigest()
+    else:
+        df = get_zones()
+        version_donnees = get_data_version("zones_localites1")
+    m["lignes"] = len(df)
 
 # === Nettoyage
 df = df.rename(columns={
@@ -38,17 +56,46 @@ if agence_selectionnee != "Toutes":
     df = df[df["Code agence"] == agence_selectionnee]
 
 # === Calcul du nombre d’expéditions
-df["Nb_expéditions"] = df.groupby("Commune")["Commune"].transform("count")
-df_unique = df.drop_duplicates(subset=["Commune"]).copy()
+df, df_unique = expeditions_par_commune(df)
+
+# === Clustering : tous les k (2 à 6) ajustés une seule fois, en parallèle, par agence et version des données
+@st.cache_data(max_entries=32, show_spinner=False)
+def clustering(agence, version, seuil_minibatch, _X):
+    return ajuster_plage(_X, ks=range(2, 7), seuil_minibatch=seuil_minibatch)
+
+with st.expander("⚙️ Paramètres avancés du clustering"):
+    seuil_minibatch = st.number_input(
+        "Nombre de communes à partir duquel utiliser MiniBatchKMeans",
+        min_value=100, value=SEUIL_MINIBATCH, step=1000
+    )
 
-# === Clustering
-n_clusters = st.slider("🔢 Nombre de clusters", 2, 6, 3)
-X = df_unique[["Distance (km)", "Nb_expéditions"]]
-kmeans = KMeans(n_clusters=n_clusters, random_state=42, n_init=10)
-df_unique["Cluster"] = kmeans.fit_predict(X)
+X = df_unique[["Distance (km)", "Nb_expéditions"]].to_numpy(dtype=float)
+with mesure("Clustering", lignes=len(X)):
+    modeles, scores = clustering(agence_selectionnee, version_donnees, int(seuil_minibatch), X)
+if not modeles:
+    st.warning("⚠️ Pas assez de communes pour former des clusters.")
+    st.stop()
+
+col_coude, col_silhouette = st.columns(2)
+col_coude.plotly_chart(
+    px.line(scores, x="k", y="Inertie", markers=True, title="📉 Méthode du coude"),
+    use_container_width=True
+)
+col_silhouette.plotly_chart(
+    px.line(scores, x="k", y="Silhouette", markers=True, title="📈 Score de silhouette"),
+    use_container_width=True
+)
+if scores["Silhouette"].notna().any():
+    k_conseille = int(scores.loc[scores["Silhouette"].idxmax(), "k"])
+    st.caption(f"💡 Meilleure silhouette pour k = {k_conseille} ({scores['Algorithme'].iloc[0]})")
+
+ks_disponibles = sorted(modeles)
+n_clusters = st.select_slider("🔢 Nombre de clusters", options=ks_disponibles, value=min(3, ks_disponibles[-1]))
+modele = modeles[n_clusters]
+df_unique["Cluster"] = modele["labels"]
 
 # === Centroïdes
-centroids = pd.DataFrame(kmeans.cluster_centers_, columns=["Distance (km)", "Nb_expéditions"])
+centroids = pd.DataFrame(modele["centres"], columns=["Distance (km)", "Nb_expéditions"])
 centroids["Cluster"] = centroids.index.astype(str)
 
 # === Clustering - graphique
@@ -90,7 +137,7 @@ if "Latitude" in df_unique.columns and "Longitude" in df_unique.columns:
 
 # === Localités éloignées
 st.subheader("🚨 Localités à plus de 40 km de leur agence")
-df_eloignees = df[df["Distance (km)"] > 40].sort_values(by="Distance (km)", ascending=False)
+df_eloignees = localites_eloignees(df)
 st.warning(f"{len(df_eloignees)} localités dépassent 40 km.")
 if len(df_eloignees) > 0:
     st.dataframe(df_eloignees[["Commune", "Code agence", "Distance (km)"]])
@@ -106,11 +153,7 @@ if len(df_eloignees) > 0:
 
 # === Analyse intelligente : suggestion agence
 st.subheader("🏗️ Suggestion intelligente d’ouverture d’agence")
-seuil_distance = 40
-seuil_nb_exp = 3
-clusters_concernes = df_unique[
-    (df_unique["Distance (km)"] > seuil_distance) & (df_unique["Nb_expéditions"] > seuil_nb_exp)
-]["Cluster"].unique()
+clusters_concernes = clusters_eloignes(df_unique)
 
 if len(clusters_concernes) > 0:
     st.error("🚨 Des zones à fort volume et éloignées sont détectées.")
@@ -127,54 +170,23 @@ else:
 with st.expander("📄 Voir toutes les données de clustering"):
     st.dataframe(df_unique.sort_values("Cluster"))
 
-from math import radians, cos, sin, asin, sqrt
-
-# Fonction pour calculer la distance Haversine
-def haversine(lat1, lon1, lat2, lon2):
-    R = 6371  # rayon de la Terre en km
-    dlat = radians(lat2 - lat1)
-    dlon = radians(lon2 - lon1)
-    a = sin(dlat / 2)**2 + cos(radians(lat1)) * cos(radians(lat2)) * sin(dlon / 2)**2
-    c = 2 * asin(sqrt(a))
-    return R * c
-
 st.subheader("🔁 Suggestions de réaffectation à une agence plus proche")
 
-suggestions = []
-agences_data = (
-    df.dropna(subset=["Latitude_agence", "Longitude_agence"])
-      .groupby("Code agence")[["Latitude_agence", "Longitude_agence"]]
-      .mean()
-      .reset_index()
-)
-
+# Coordonnées exactes des agences (cordonnee_agence), sinon moyenne des coordonnées agence des localités
+agences_data = coordonnees_agences(get_coordonnees_agences(), df)
 
-for _, row in df_eloignees.iterrows():
-    min_dist = row["Distance (km)"]
-    current_agence = row["Code agence"]
-    best_agence = current_agence
+col1, col2 = st.columns(2)
+toutes_localites = col1.checkbox("Analyser toutes les localités (pas seulement > 40 km)")
+k_max = min(5, len(agences_data))
+k_agences = col2.slider("Nombre d'agences proches à proposer", 1, k_max, 1) if k_max > 1 else 1
+df_candidats = df if toutes_localites else df_eloignees
 
-    for _, agence in agences_data.iterrows():
-        lat_ag, lon_ag = agence["Latitude_agence"], agence["Longitude_agence"]
-        dist = haversine(row["Latitude"], row["Longitude"], lat_ag, lon_ag)
-
-        if dist < min_dist:
-            min_dist = dist
-            best_agence = agence["Code agence"]
-
-    if best_agence != current_agence:
-        suggestions.append({
-            "Commune": row["Commune"],
-            "Agence actuelle": current_agence,
-            "Agence suggérée": best_agence,
-            "Distance actuelle (km)": round(row["Distance (km)"], 1),
-            "Distance suggérée (km)": round(min_dist, 1)
-        })
+with mesure("Réaffectation", lignes=len(df_candidats)):
+    suggestions_df = suggestions_reaffectation(df_candidats, agences_data, k_agences)
 
 # Affichage
-if suggestions:
-    st.success(f"✅ {len(suggestions)} localités peuvent être réaffectées à une agence plus proche.")
-    suggestions_df = pd.DataFrame(suggestions)
+if len(suggestions_df) > 0:
+    st.success(f"✅ {len(suggestions_df)} localités peuvent être réaffectées à une agence plus proche.")
     st.dataframe(suggestions_df)
 
     st.download_button(
@@ -186,35 +198,55 @@ if suggestions:
 else:
     st.info("ℹ️ Aucune meilleure agence trouvée pour réaffectation.")
 
-from shapely.geometry import MultiPoint
-import folium
-
 st.subheader("🏗️ Suggestion stratégique : où ouvrir une nouvelle agence ?")
 
-suggestion_coords = []  # pour générer la carte finale
+# Demande pondérée par les expéditions réelles (pal_tranche), sinon par le nombre de localités
+cube_palette = get_cube_palette()
+if "Commune" in cube_palette.columns and not cube_palette.empty:
+    poids = poids_par_commune(cube_palette)
+    version_poids = get_data_version("pal_tranche")
+    source_poids = "expéditions (pal_tranche)"
+else:
+    poids = df_unique.set_index(cle_commune(df_unique["Commune"]))["Nb_expéditions"]
+    version_poids = version_donnees
+    source_poids = "nombre de localités"
 
-for c in clusters_concernes:
-    zone = df_unique[df_unique["Cluster"] == c]
-    points = list(zip(zone["Longitude"], zone["Latitude"]))
-    
-    if len(points) >= 3:  # au moins 3 points pour éviter erreur
-        center = MultiPoint(points).centroid
-        lat_sugg, lon_sugg = center.y, center.x
+demande = demande_communes(df_unique, poids)
 
-        st.markdown(f"### 🧭 Cluster {c}")
-        st.markdown(f"- 📍 Centre géographique : `{lat_sugg:.5f}, {lon_sugg:.5f}`")
-        st.markdown(f"- Moyenne distance : {round(zone['Distance (km)'].mean(), 1)} km")
-        st.markdown(f"- Nombre total d’expéditions : {int(zone['Nb_expéditions'].sum())}")
-        st.markdown("✅ **Suggestion : Étudier l’ouverture d’une agence ici.**")
+# p-médiane pondérée : candidats = communes existantes, agences actuelles conservées (référence : la plus proche)
+@st.cache_data(max_entries=32, show_spinner="Optimisation des implantations…")
+def implantation(agence, version, version_poids, nb_agences, _demande, _agences):
+    return implanter_agences(_demande, nb_agences, agences=_agences, max_candidats=MAX_CANDIDATS)
 
-        suggestion_coords.append({
-            "Cluster": c,
-            "Latitude": lat_sugg,
-            "Longitude": lon_sugg,
-            "Expéditions": int(zone['Nb_expéditions'].sum())
-        })
+nb_nouvelles = st.slider("Nombre de nouvelles agences à implanter", 1, 5, 1)
+with mesure("Implantation", lignes=len(demande)):
+    sites, affectation, km_economises = implantation(
+        agence_selectionnee, version_donnees, version_poids, nb_nouvelles, demande, agences_data
+    )
 
+if sites.empty:
+    st.success("✅ Aucune implantation ne réduit les distances parcourues.")
+else:
+    km_avant = float((affectation["Distance avant (km)"] * affectation["Poids"]).sum())
+    col1, col2 = st.columns(2)
+    col1.metric("🚚 Km pondérés économisés", f"{km_economises:,.0f}".replace(",", " "))
+    col2.metric("📉 Réduction", f"{100 * km_economises / km_avant:.1f} %" if km_avant else "–")
+    st.caption(f"Pondération : {source_poids}")
+    st.dataframe(sites)
+
+    # Carte : nouvelles agences en rouge, communes qu'elles desserviraient en bleu
+    carte_sites = pd.concat([
+        affectation.dropna(subset=["Site"]).assign(Couleur="#1f77b4", Taille=300),
+        sites.assign(Couleur="#d62728", Taille=2000),
+    ])
+    st.map(carte_sites, latitude="Latitude", longitude="Longitude", color="Couleur", size="Taille")
 
+    st.download_button(
+        "📥 Télécharger les communes desservies par les nouvelles agences",
+        data=affectation.dropna(subset=["Site"]).to_csv(index=False),
+        file_name="implantation_nouvelles_agences.csv",
+        mime="text/csv"
+    )
 
 st.download_button(
     "💾 Télécharger toutes les données (CSV)",
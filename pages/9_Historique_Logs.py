@@ -1,6 +1,9 @@
 import streamlit as st
-import pandas as pd
-from database import get_engine
+from datetime import datetime, time, timedelta
+from database import ensure_logs_indexes, get_logs_filter_values, get_logs_page
+from performance import suivre_page, mesure
+
+suivre_page(__file__)
 
 # === Authentification
 if "authenticated" not in st.session_state or not st.session_state["authenticated"]:
@@ -14,7 +17,54 @@ if st.session_state.get("role") != "admin":
 
 st.title("🕵️ Historique des actions")
 
-engine = get_engine()
-df_logs = pd.read_sql("SELECT * FROM logs ORDER BY timestamp DESC", get_engine())
+ensure_logs_indexes()
+users, actions = get_logs_filter_values()
+
+# === Filtres (appliqués côté serveur)
+col1, col2, col3 = st.columns(3)
+selected_user = col1.selectbox("👤 Utilisateur", ["Tous"] + list(users))
+selected_action = col2.selectbox("⚙️ Action", ["Toutes"] + list(actions))
+page_size = col3.selectbox("📄 Lignes par page", [25, 50, 100, 200], index=1)
+
+col1, col2, col3 = st.columns(3)
+date_debut = col1.date_input("📅 Du", value=None)
+date_fin = col2.date_input("📅 Au", value=None)
+recherche = col3.text_input("🔍 Rechercher dans les détails")
+
+filtres = {
+    "username": None if selected_user == "Tous" else selected_user,
+    "action": None if selected_action == "Toutes" else selected_action,
+    "start": datetime.combine(date_debut, time.min) if date_debut else None,
+    "end": datetime.combine(date_fin, time.min) + timedelta(days=1) if date_fin else None,
+    "search": recherche.strip() or None,
+}
+
+# === Pile des curseurs de pagination, réinitialisée quand les filtres changent
+cle_filtres = (tuple(filtres.items()), page_size)
+if st.session_state.get("logs_filtres") != cle_filtres:
+    st.session_state["logs_filtres"] = cle_filtres
+    st.session_state["logs_curseurs"] = [None]
+
+curseurs = st.session_state["logs_curseurs"]
+with mesure("Page de logs") as m:
+    df_logs, has_more = get_logs_page(limit=page_size, after=curseurs[-1], **filtres)
+    m["lignes"] = len(df_logs)
+
+st.dataframe(df_logs, use_container_width=True)
+
+col1, col2, col3 = st.columns([1, 2, 1])
+if col1.button("⬅️ Page précédente", disabled=len(curseurs) == 1):
+    curseurs.pop()
+    st.rerun()
+col2.markdown(f"Page **{len(curseurs)}**")
+if col3.button("Page suivante ➡️", disabled=not has_more):
+    dernier = df_logs.iloc[-1]
+    curseurs.append((dernier["timestamp"], int(dernier["id"])))
+    st.rerun()
 
-st.dataframe(df_logs)
+st.download_button(
+    "📥 Télécharger cette page",
+    data=df_logs.to_csv(index=False).encode("utf-8"),
+    file_name="historique_logs.csv",
+    mime="text/csv"
+)
@@ -0,0 +1,189 @@
+import functools
+import re
+import threading
+import time
+from collections import defaultdict, deque
+from contextlib import contextmanager
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import streamlit as st
+
+TAILLE_TAMPON = 500  # dernières mesures conservées par (page, section)
+TAILLE_JOURNAL_SQL = 2000  # dernières requêtes conservées
+SEUIL_REQUETE_LENTE = 0.5  # secondes
+HORS_PAGE = "(hors page)"
+
+# Page en cours d'exécution dans le thread du script (chaque session Streamlit a le sien)
+_contexte = threading.local()
+
+
+def suivre_page(fichier):
+    # À appeler en tête de page : suivre_page(__file__)
+    _contexte.page = Path(fichier).stem
+
+
+def page_courante():
+    return getattr(_contexte, "page", HORS_PAGE)
+
+
+class RegistrePerformances:
+    # Tampon circulaire de durées par (page, section) + compteurs cumulés, partagé par le processus
+    def __init__(self, taille=TAILLE_TAMPON):
+        self.taille = taille
+        self._lock = threading.Lock()
+        self._durees = defaultdict(lambda: deque(maxlen=self.taille))
+        self._appels = defaultdict(int)
+        self._lignes = defaultdict(int)
+
+    def enregistrer(self, page, section, duree, lignes=None):
+        cle = (page, section)
+        with self._lock:
+            self._durees[cle].append(duree)
+            self._appels[cle] += 1
+            if lignes is not None:
+                self._lignes[cle] += int(lignes)
+
+    def reinitialiser(self):
+        with self._lock:
+            self._durees.clear()
+            self._appels.clear()
+            self._lignes.clear()
+
+    def statistiques(self):
+        with self._lock:
+            mesures = {cle: np.array(d) for cle, d in self._durees.items()}
+            appels, lignes = dict(self._appels), dict(self._lignes)
+        colonnes = ["Page", "Section", "Appels", "p50 (ms)", "p95 (ms)", "Max (ms)", "Total (s)", "Lignes traitées"]
+        if not mesures:
+            return pd.DataFrame(columns=colonnes)
+        # Percentiles calculés sur le tampon (dernières mesures) ; appels et lignes cumulés depuis le démarrage
+        return pd.DataFrame([
+            [page, section, appels[(page, section)],
+             np.percentile(d, 50) * 1000, np.percentile(d, 95) * 1000, d.max() * 1000, d.sum(),
+             lignes.get((page, section), 0)]
+            for (page, section), d in mesures.items()
+        ], columns=colonnes).round({"p50 (ms)": 1, "p95 (ms)": 1, "Max (ms)": 1, "Total (s)": 3})
+
+
+@st.cache_resource
+def get_registre():
+    return RegistrePerformances()
+
+
+def _nb_lignes(resultat):
+    if isinstance(resultat, (pd.DataFrame, pd.Series)):
+        return len(resultat)
+    if isinstance(resultat, tuple) and resultat and isinstance(resultat[0], (pd.DataFrame, pd.Series)):
+        return len(resultat[0])
+    return None
+
+
+@contextmanager
+def mesure(section, lignes=None):
+    # with mesure("Crosstab") as m: ... ; m["lignes"] = len(df) pour compter les lignes traitées
+    etat = {"lignes": lignes}
+    debut = time.perf_counter()
+    try:
+        yield etat
+    finally:
+        get_registre().enregistrer(page_courante(), section, time.perf_counter() - debut, etat["lignes"])
+
+
+def chronometre(section=None):
+    # Décorateur : durée de la fonction et nombre de lignes du DataFrame renvoyé
+    def decorateur(fonction):
+        nom = section or fonction.__name__
+
+        @functools.wraps(fonction)
+        def enveloppe(*args, **kwargs):
+            debut = time.perf_counter()
+            resultat = fonction(*args, **kwargs)
+            get_registre().enregistrer(page_courante(), nom, time.perf_counter() - debut, _nb_lignes(resultat))
+            return resultat
+        return enveloppe
+    return decorateur
+
+
+# === Requêtes SQL (événements before/after_cursor_execute du moteur SQLAlchemy)
+def normaliser_requete(statement, longueur=300):
+    return re.sub(r"\s+", " ", statement).strip()[:longueur]
+
+
+class RegistreRequetes:
+    # Journal circulaire des requêtes : durée, lignes, octets reçus, page appelante
+    def __init__(self, taille=TAILLE_JOURNAL_SQL):
+        self._lock = threading.Lock()
+        self._journal = deque(maxlen=taille)
+        self._derniere = threading.local()
+
+    def enregistrer(self, page, requete, duree, lignes=None):
+        entree = {
+            "Horodatage": pd.Timestamp.now(), "Page": page, "Requête": requete,
+            "Durée (ms)": duree * 1000, "Lignes": lignes, "Octets": None,
+        }
+        with self._lock:
+            self._journal.append(entree)
+        self._derniere.entree = entree
+
+    def noter_octets(self, octets):
+        # Taille des données reçues, rattachée à la dernière requête du thread courant
+        entree = getattr(self._derniere, "entree", None)
+        if entree is not None:
+            entree["Octets"] = int(octets)
+
+    def reinitialiser(self):
+        with self._lock:
+            self._journal.clear()
+
+    def journal(self):
+        with self._lock:
+            return pd.DataFrame(list(self._journal), columns=[
+                "Horodatage", "Page", "Requête", "Durée (ms)", "Lignes", "Octets"
+            ])
+
+    def statistiques(self):
+        journal = self.journal()
+        if journal.empty:
+            return pd.DataFrame(columns=[
+                "Page", "Requête", "Appels", "p50 (ms)", "p95 (ms)", "Max (ms)", "Total (s)", "Lignes", "Octets"
+            ])
+        groupes = journal.groupby(["Page", "Requête"], sort=False)
+        stats = groupes.agg(
+            Appels=("Durée (ms)", "size"),
+            p50=("Durée (ms)", "median"),
+            Max=("Durée (ms)", "max"),
+            Total=("Durée (ms)", "sum"),
+            Lignes=("Lignes", "sum"),
+            Octets=("Octets", "sum"),
+        )
+        stats.insert(2, "p95", groupes["Durée (ms)"].quantile(0.95))
+        stats["Total"] /= 1000
+        stats = stats.rename(columns={"p50": "p50 (ms)", "p95": "p95 (ms)", "Max": "Max (ms)", "Total": "Total (s)"})
+        return stats.reset_index().round({"p50 (ms)": 1, "p95 (ms)": 1, "Max (ms)": 1, "Total (s)": 3})
+
+
+@st.cache_resource
+def get_registre_sql():
+    return RegistreRequetes()
+
+
+def instrumenter_moteur(engine, seuil_lent=SEUIL_REQUETE_LENTE):
+    # Chronomètre chaque requête du moteur ; les requêtes au-delà du seuil sont signalées dans les logs
+    from sqlalchemy import event
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def avant(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("debuts_requetes", []).append(time.perf_counter())
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def apres(conn, cursor, statement, parameters, context, executemany):
+        duree = time.perf_counter() - conn.info["debuts_requetes"].pop()
+        lignes = cursor.rowcount if cursor.rowcount is not None and cursor.rowcount >= 0 else None
+        page, requete = page_courante(), normaliser_requete(statement)
+        get_registre_sql().enregistrer(page, requete, duree, lignes)
+        if duree >= seuil_lent:
+            print(f"⚠️ Requête lente ({duree * 1000:.0f} ms, {lignes} lignes, page {page}) : {requete}")
+
+    return engine
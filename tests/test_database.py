@@ -0,0 +1,162 @@
+import io
+
+import numpy as np
+import pandas as pd
+import pytest
+
+pgserver = pytest.importorskip("pgserver")
+sqlalchemy = pytest.importorskip("sqlalchemy")
+
+try:
+    import database
+except Exception as e:  # secrets.toml [database] requis à l'import
+    pytest.skip(f"database non importable : {e}", allow_module_level=True)
+
+from analytics.tranches import cube_palette, cube_poids
+from donnees_synthetiques import format_base, jeu_de_donnees
+
+
+def _expeditions():
+    # Table telle qu'en base : libellés en texte, puis cas limites (bornes, hors tranches, NaN, décimales françaises, espaces)
+    df = format_base(jeu_de_donnees(1)["expeditions"])
+    df = df.astype({c: str for c in df.columns if isinstance(df[c].dtype, pd.CategoricalDtype)})
+    df[["Poids", "UM"]] = df[["Poids", "UM"]].astype(object)
+    df.loc[:14, "Poids"] = [0, 10, 9.99, 3000, 2999.5, -1, None, "12,5", " 20", 2000, "0,5", np.nan, 30, 100, 1999.9]
+    df.loc[:14, "UM"] = [0, 1, 1.5, 6, 6.01, 7, None, "2,5", 30, -2, 0.001, 2, 3, 4, 5]
+    df.loc[:3, "Zone"] = " Zone 1 "
+    df.loc[4:7, "Code agence"] = df.loc[4:7, "Code agence"] + " "
+    df.loc[8:11, "Commune"] = " " + df.loc[8:11, "Commune"]
+    df["Date"] = pd.Timestamp("2025-01-01") + pd.to_timedelta(np.arange(len(df)) % 90, unit="D")
+    df.insert(0, "id", range(1, len(df) + 1))
+    return df
+
+
+@pytest.fixture(scope="module")
+def base(tmp_path_factory):
+    serveur = pgserver.get_server(tmp_path_factory.mktemp("pgdata"))
+    engine = sqlalchemy.create_engine(serveur.get_uri().replace("postgresql://", "postgresql+psycopg2://"))
+    df = _expeditions()
+    for table in ("tranche_zone", "pal_tranche"):
+        df.to_sql(table, engine, if_exists="replace", index=False)
+    with pytest.MonkeyPatch.context() as mp:
+        mp.setattr(database, "get_engine", lambda: engine)
+        mp.setattr(database, "SNAPSHOT_DIR", tmp_path_factory.mktemp("snapshots"))
+        database.get_colonnes.clear()
+        yield engine
+    database.get_colonnes.clear()
+    engine.dispose()
+
+
+@pytest.mark.parametrize("table, agregat, builder", [
+    ("tranche_zone", database.agreger_poids, cube_poids),
+    ("pal_tranche", database.agreger_palette, cube_palette),
+])
+def test_cube_sql_identique_au_calcul_pandas(base, table, agregat, builder):
+    # Même cube (lignes, libellés nettoyés, types compacts) que le calcul pandas de secours sur la table typée
+    sql = agregat()
+    secours = builder(database.load_table(table, version="test"))
+    pd.testing.assert_frame_equal(sql, secours, check_exact=False, rtol=1e-12)
+
+
+def test_filtre_zone_sans_espaces(base):
+    cube = database.agreger_palette()
+    filtre = database.agreger_palette(zone="Zone 1")
+    assert filtre["Nb_exp"].sum() == cube.loc[cube["Zone"] == "Zone 1", "Nb_exp"].sum()
+
+
+def test_lecture_partielle_en_base(base):
+    # Colonnes et filtres transmis à la base (pas de snapshot pour cette version)
+    df = database.load_table(
+        "tranche_zone", version="sql", colonnes=["Zone", "Code agence", "Poids"], zone="Zone 1",
+        debut="2025-02-01", fin="2025-03-01",
+    )
+    complet = database.load_table("tranche_zone", version="complet")
+    attendu = complet[
+        (complet["Zone"] == "Zone 1") & (complet["Date"] >= "2025-02-01") & (complet["Date"] < "2025-03-01")
+    ]
+    assert list(df.columns) == ["Zone", "Code agence", "Poids"]
+    assert len(df) == len(attendu) > 0
+    assert df["Zone"].astype(str).eq("Zone 1").all()
+
+
+def test_filtre_date_sans_colonne(base, monkeypatch):
+    monkeypatch.setattr(database, "COLONNE_DATE", "Inexistante")
+    with pytest.raises(ValueError):
+        database.load_table("tranche_zone", version="sql", debut="2025-01-01")
+
+
+def test_cube_filtre_calcule_en_base(base, monkeypatch):
+    # Snapshot absent : seule l'agence demandée est agrégée, et le cube partiel n'est pas mis en cache
+    ecrits = []
+    monkeypatch.setattr(database, "_write_snapshot", lambda *args: ecrits.append(args))
+    cube = database.agreger_palette()
+    agence = str(cube["Code agence"].dropna().iloc[0])
+    filtre = database.load_derived(
+        "pal_tranche", "cube_palette_test", cube_palette, agence=agence, agregat=database.agreger_palette
+    )
+    attendu = cube[cube["Code agence"] == agence]
+    assert not ecrits
+    assert filtre["Code agence"].astype(str).eq(agence).all()
+    assert filtre["Nb_exp"].sum() == attendu["Nb_exp"].sum()
+
+
+CSV_LOCALITES = (
+    "Commune;Zone;Code agence;Latitude;Longitude;Latitude_agence;Longitude_agence;Distance (km)\n"
+    "A ;Zone 2;NT1;49,1;0,5;49;0,4;12,5\n"
+    ";;;;;;;\n"
+    "C;Zone 1;NT1;49,2;0,6;49;0,4;20\n"
+)
+
+
+@pytest.fixture
+def localites(base):
+    with base.begin() as conn:
+        conn.execute(sqlalchemy.text("DROP TABLE IF EXISTS zones_localites1"))
+        conn.execute(sqlalchemy.text("""
+            CREATE TABLE zones_localites1 (
+                id serial PRIMARY KEY, commune text, zone text, code_agence text,
+                latitude double precision, longitude double precision,
+                latitude_agence double precision, longitude_agence double precision,
+                "distance (km)" double precision
+            )
+        """))
+        conn.execute(sqlalchemy.text("""
+            INSERT INTO zones_localites1 (commune, zone, code_agence, latitude, longitude,
+                                          latitude_agence, longitude_agence, "distance (km)")
+            VALUES ('A', 'Zone 1', 'NT1', 49.1, 0.5, 49, 0.4, 12.5),
+                   ('B', 'Zone 1', 'NT1', 49.3, 0.7, 49, 0.4, 30),
+                   ('X', 'Zone 3', 'NT2', 48.0, 1.0, 48, 1.1, 8)
+        """))
+    return base
+
+
+def _localites(engine):
+    return pd.read_sql(
+        'SELECT commune, zone, code_agence FROM zones_localites1 ORDER BY code_agence, commune', engine
+    )
+
+
+def test_import_localites(localites):
+    df = pd.read_csv(io.StringIO(CSV_LOCALITES), sep=";")
+    attendu = {"lignes_fichier": 2, "inserees": 1, "modifiees": 1, "inchangees": 0, "supprimees": 1}
+
+    # Simulation : mêmes comptes, rien d'écrit
+    avant = _localites(localites)
+    assert database.bulk_upsert_localites(df, delete_missing=True, dry_run=True) == attendu
+    pd.testing.assert_frame_equal(_localites(localites), avant)
+
+    # Suppression limitée aux agences du fichier (X / NT2 conservée), ligne vide ignorée
+    assert database.bulk_upsert_localites(df, delete_missing=True) == attendu
+    apres = _localites(localites)
+    assert apres.values.tolist() == [["A", "Zone 2", "NT1"], ["C", "Zone 1", "NT1"], ["X", "Zone 3", "NT2"]]
+
+    # Réimport identique : tout est inchangé
+    assert database.bulk_upsert_localites(df) == {
+        "lignes_fichier": 2, "inserees": 0, "modifiees": 0, "inchangees": 2, "supprimees": 0,
+    }
+
+
+def test_import_localites_sans_suppression(localites):
+    df = pd.read_csv(io.StringIO(CSV_LOCALITES), sep=";")
+    assert database.bulk_upsert_localites(df)["supprimees"] == 0
+    assert sorted(_localites(localites)["commune"]) == ["A", "B", "C", "X"]
@@ -0,0 +1,79 @@
+import io
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import ingestion
+from ingestion import lire_csv
+
+NUMERIQUES = {"Poids": np.float64, "UM": np.float64}
+CATEGORIES = ["Code agence", "Zone", "Commune"]
+
+CSV = (
+    "Code agence;Zone;Commune;Poids;UM\n"
+    "NT14G;Zone 1;CAEN;12,5;1\n"
+    "NT14G; Zone 2 ;HÉROUVILLE SAINT-CLAIR;3;2\n"
+    "NT50S;Zone 1;SAINT-LÔ;1500,75;\n"
+    "NT50S;Zone 3;CÉRENCES;0,5;6\n"
+    "NT61L;Zone 2;ALENÇON;40;3\n"
+)
+
+
+def _reference(data, encoding):
+    # Lecture pandas simple, pour comparaison
+    ref = pd.read_csv(io.BytesIO(data), sep=";", encoding=encoding, decimal=",", dtype={c: str for c in CATEGORIES})
+    for col in CATEGORIES:
+        ref[col] = ref[col].str.strip()
+    return ref.astype({"Poids": np.float64, "UM": np.float64})
+
+
+def _comparer(df, ref):
+    assert list(df.columns) == list(ref.columns)
+    for col in CATEGORIES:
+        assert isinstance(df[col].dtype, pd.CategoricalDtype)
+        assert df[col].astype(str).tolist() == ref[col].tolist()
+    for col in NUMERIQUES:
+        assert df[col].dtype == np.float64
+        np.testing.assert_array_equal(df[col].to_numpy(), ref[col].to_numpy())
+
+
+@pytest.mark.parametrize("encodage", ["latin1", "utf-8", "utf-8-sig"])
+def test_encodages(encodage):
+    data = CSV.encode(encodage)
+    assert ingestion.detecter_encodage(io.BytesIO(data)) == encodage
+    df = lire_csv(io.BytesIO(data), numeriques=NUMERIQUES, categories=CATEGORIES)
+    _comparer(df, _reference(data, encodage))
+
+
+def test_decimales_francaises():
+    df = lire_csv(io.BytesIO(CSV.encode("utf-8")), numeriques=NUMERIQUES, categories=CATEGORIES)
+    assert df["Poids"].tolist() == [12.5, 3.0, 1500.75, 0.5, 40.0]
+    assert np.isnan(df["UM"].iloc[2])
+
+
+def test_suite_latin1_apres_echantillon_utf8(monkeypatch):
+    # Début du fichier décodable en UTF-8, accents latin1 plus loin : relu en latin1
+    monkeypatch.setattr(ingestion, "TAILLE_ECHANTILLON", 40)
+    data = CSV.encode("latin1")
+    df = lire_csv(io.BytesIO(data), numeriques=NUMERIQUES, categories=CATEGORIES)
+    _comparer(df, _reference(data, "latin1"))
+
+
+def test_categories_differentes_entre_blocs():
+    # Blocs de 2 lignes : chaque bloc a ses propres catégories, réunies à l'assemblage
+    data = CSV.encode("utf-8")
+    df = lire_csv(io.BytesIO(data), numeriques=NUMERIQUES, categories=CATEGORIES, taille_bloc=2)
+    _comparer(df, _reference(data, "utf-8"))
+    assert sorted(df["Code agence"].cat.categories) == ["NT14G", "NT50S", "NT61L"]
+
+
+def test_colonnes_selectionnees():
+    df = lire_csv(io.BytesIO(CSV.encode("utf-8")), colonnes=["Zone", "Poids"], numeriques=NUMERIQUES, categories=CATEGORIES)
+    assert list(df.columns) == ["Zone", "Poids"]
+
+
+def test_plafond_memoire():
+    with pytest.raises(MemoryError):
+        lire_csv(io.BytesIO(CSV.encode("utf-8")), numeriques=NUMERIQUES, categories=CATEGORIES,
+                 taille_bloc=2, max_memoire_mo=0.0001)
@@ -0,0 +1,56 @@
+import numpy as np
+import pandas as pd
+
+from analytics.tarifs import balayage_tarifs, calculer_tarifs
+
+TRANCHES = ["10", "20", "30"]
+FORFAITS = {"10": 10.0, "20": 14.0, "30": 18.0}
+REFERENCE = pd.DataFrame(
+    {"Zone 1": [50.0, 40.0, 30.0], "Zone 2": [30.0, 35.0, 40.0], "Zone 3": [20.0, 25.0, 30.0]}, index=TRANCHES
+)
+# Mix réel plus lointain que la référence
+REELLE = pd.DataFrame(
+    {"Zone 1": [30.0, 25.0, 20.0], "Zone 2": [30.0, 35.0, 30.0], "Zone 3": [40.0, 40.0, 50.0]}, index=TRANCHES
+)
+GRILLE_A = np.linspace(0.1, 4.0, 9)
+GRILLE_C = np.linspace(0.5, 4.0, 8)
+
+
+def _actuels(a=2.0, c2=1.5, c3=3.0):
+    return calculer_tarifs(REFERENCE, FORFAITS, a, 0.0, c2, c3).set_index("Tranche")
+
+
+def test_grilles_neutres_en_recette():
+    cube, _ = balayage_tarifs(REELLE, FORFAITS, _actuels(), GRILLE_A, GRILLE_C, GRILLE_C)
+    forfaits = cube["Tranche"].map(FORFAITS)
+    assert np.allclose(cube["Total pondéré (€)"], forfaits, atol=0.02)
+
+
+def test_parametres_actuels_en_tete_sur_la_reference():
+    _, synthese = balayage_tarifs(REFERENCE, FORFAITS, _actuels(), [1.0, 2.0, 3.0], [1.0, 1.5, 2.0], [2.0, 3.0, 4.0])
+    meilleure = synthese.nsmallest(1, "Écart moyen aux tarifs actuels (€)").iloc[0]
+    assert (meilleure["Écart fixe (€)"], meilleure["Coef Zone 2"], meilleure["Coef Zone 3"]) == (2.0, 1.5, 3.0)
+    assert meilleure["Écart moyen aux tarifs actuels (€)"] < 0.01
+
+
+def test_classement_depend_de_tous_les_parametres():
+    _, synthese = balayage_tarifs(REELLE, FORFAITS, _actuels(), GRILLE_A, GRILLE_C, GRILLE_C)
+    colonne = "Écart moyen aux tarifs actuels (€)"
+    meilleures = synthese.nsmallest(8, colonne)
+    # L'écart fixe minimal (tarifs uniformes) n'est pas la meilleure grille
+    assert meilleures["Écart fixe (€)"].min() > GRILLE_A.min()
+    # À écart fixe donné, le classement varie avec les coefficients et a un minimum intérieur
+    for a in GRILLE_A[1:]:
+        plan = synthese[synthese["Écart fixe (€)"] == a].set_index(["Coef Zone 2", "Coef Zone 3"])[colonne]
+        assert plan.nunique() > 1
+    plan = synthese[synthese["Écart fixe (€)"] == GRILLE_A[4]].set_index(["Coef Zone 2", "Coef Zone 3"])[colonne]
+    c2, c3 = plan.idxmin()
+    assert GRILLE_C.min() < c3 < GRILLE_C.max()
+
+
+def test_ecart_pondere_par_les_volumes():
+    _, sans = balayage_tarifs(REELLE, FORFAITS, _actuels(), [2.0], [2.0], [3.0])
+    _, avec = balayage_tarifs(
+        REELLE, FORFAITS, _actuels(), [2.0], [2.0], [3.0], volumes=pd.Series([0, 0, 10], index=TRANCHES),
+    )
+    assert not np.isclose(sans["Écart moyen aux tarifs actuels (€)"].iloc[0], avec["Écart moyen aux tarifs actuels (€)"].iloc[0])